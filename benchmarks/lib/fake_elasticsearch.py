@@ -0,0 +1,355 @@
+"""An in process stand in for an Elasticsearch cluster.
+Responses are encoded as json and decoded with the serializer of the table,
+so the decoding cost is the same as with a real cluster."""
+
+# pylint: disable=useless-object-inheritance, too-many-arguments, unused-argument, invalid-name
+# pylint: disable=too-many-return-statements, too-many-instance-attributes
+
+import itertools
+import json
+import re
+import threading
+import time
+import zlib
+
+RANGE_OPERATORS = {
+    "gt": lambda value, bound: value > bound,
+    "gte": lambda value, bound: value >= bound,
+    "lt": lambda value, bound: value < bound,
+    "lte": lambda value, bound: value <= bound,
+}
+
+
+class FakeElasticsearch(object):
+    """Serves deterministic search, scroll, point in time, get and bulk responses
+    from a list of documents.
+    Every request waits for the latency, which stands in for the network and the cluster.
+    """
+
+    def __init__(self, documents, latency=0.0):
+        self.documents = documents
+        self.documents_by_id = {document["_id"]: document for document in documents}
+        self.latency = latency
+        self.serializer = None
+        self.indices = FakeIndices(self)
+        self.scrolls = {}
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.timings = {"server": 0.0, "decode": 0.0}
+        self.requests = 0
+        self.indexed = 0
+
+    def connect(self, options):
+        """Use the serializer of the table to decode responses, as the real client would"""
+
+        self.serializer = options.serializer
+        return self
+
+    def reset_timings(self):
+        """Forget the time spent so far"""
+
+        with self.lock:
+            self.timings = {"server": 0.0, "decode": 0.0}
+            self.requests = 0
+
+    def info(self, **arguments):
+        """The version of the cluster"""
+
+        return self._respond({"version": {"number": "7.17.6"}})
+
+    def search(
+        self, index=None, body=None, size=None, from_=None, scroll=None, **arguments
+    ):
+        """Search the documents, paging with scroll, search_after or from and size"""
+
+        if "q" in arguments:
+            raise ValueError("The fake cluster cannot evaluate query strings")
+        body = body or {}
+        size = body.get("size", size if size is not None else 10)
+        documents = self._matching(body.get("query"))
+        if "slice" in body:
+            documents = _slice(documents, body["slice"])
+
+        if "pit" in body:
+            start = body.get("search_after", [-1])[0] + 1
+            response = self._page(documents, start, size, arguments)
+            response["pit_id"] = body["pit"]["id"]
+        elif scroll:
+            scroll_id = "scroll-{number}".format(number=next(self.ids))
+            self.scrolls[scroll_id] = (documents, size, size)
+            response = self._page(documents, 0, size, arguments)
+            response["_scroll_id"] = scroll_id
+        else:
+            start = from_ or body.get("from", 0)
+            response = self._page(documents, start, size, arguments)
+        return self._respond(response)
+
+    def scroll(self, scroll_id=None, scroll=None, **arguments):
+        """Read the next page of the scroll"""
+
+        documents, size, position = self.scrolls[scroll_id]
+        self.scrolls[scroll_id] = (documents, size, position + size)
+        response = self._page(documents, position, size, arguments)
+        response["_scroll_id"] = scroll_id
+        return self._respond(response)
+
+    def clear_scroll(self, scroll_id=None, **arguments):
+        """Release the scroll"""
+
+        self.scrolls.pop(scroll_id, None)
+        return self._respond({"succeeded": True})
+
+    def open_point_in_time(self, index=None, keep_alive=None, **arguments):
+        """Open a point in time"""
+
+        return self._respond({"id": "pit-{number}".format(number=next(self.ids))})
+
+    def close_point_in_time(self, **arguments):
+        """Close a point in time"""
+
+        return self._respond({"succeeded": True})
+
+    def count(self, body=None, **arguments):
+        """Count the matching documents"""
+
+        query = (body or {}).get("query")
+        return self._respond({"count": len(self._matching(query))})
+
+    def get(self, index=None, id=None, **arguments):
+        """Read a single document"""
+        # pylint: disable=redefined-builtin
+
+        document = self.documents_by_id[str(id)]
+        return self._respond(dict(document, found=True))
+
+    def bulk(self, body=None, refresh=None, **arguments):
+        """Accept the actions without storing them"""
+
+        items = []
+        lines = body.splitlines() if isinstance(body, str) else body
+        lines = iter(lines)
+        for line in lines:
+            action = json.loads(line)
+            ((name, metadata),) = action.items()
+            if name != "delete":
+                next(lines)
+            items.append({name: {"_id": metadata.get("_id"), "status": 200}})
+        self.indexed += len(items)
+        return self._respond({"took": 1, "errors": False, "items": items})
+
+    def _matching(self, query):
+        """Filter the documents with the query, refusing the clauses that cannot be evaluated"""
+
+        if query is None:
+            return self.documents
+        ids = _find_required_ids(query)
+        if ids is None:
+            documents = self.documents
+        else:
+            documents = [
+                self.documents_by_id[value]
+                for value in ids
+                if value in self.documents_by_id
+            ]
+        return [document for document in documents if _matches(query, document)]
+
+    def _page(self, documents, start, size, arguments):
+        source = arguments.get("_source")
+        fields = _get_hit_fields(arguments.get("filter_path"))
+        hits = []
+        for position, document in enumerate(
+            documents[start : start + size], start=start
+        ):
+            hit = {
+                "_index": "benchmark",
+                "_type": "_doc",
+                "_id": document["_id"],
+                "_score": 1.0,
+                "_source": _filter_source(document["_source"], source),
+                "sort": [position],
+            }
+            if source is False:
+                del hit["_source"]
+            if fields is not None:
+                hit = {key: value for key, value in hit.items() if key in fields}
+            hits.append(hit)
+        return {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": len(documents), "relation": "eq"},
+                "hits": hits,
+            },
+        }
+
+    def _respond(self, response):
+        """Encode the response as a cluster would, wait for the latency,
+        and decode it as the client would"""
+
+        started = time.perf_counter()
+        payload = json.dumps(response).encode("utf-8")
+        if self.latency:
+            time.sleep(self.latency)
+        encoded = time.perf_counter()
+        result = self.serializer.loads(payload)
+        decoded = time.perf_counter()
+
+        with self.lock:
+            self.timings["server"] += encoded - started
+            self.timings["decode"] += decoded - encoded
+            self.requests += 1
+        return result
+
+
+class FakeIndices(object):
+    """The index apis of the fake cluster"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def refresh(self, **arguments):
+        """Refresh the index"""
+
+        return self.client._respond({})  # pylint: disable=protected-access
+
+    def stats(self, **arguments):
+        """The document count of the index"""
+
+        count = len(self.client.documents)
+        return self.client._respond(  # pylint: disable=protected-access
+            {"_all": {"primaries": {"docs": {"count": count}}}}
+        )
+
+    def get_mapping(self, **arguments):
+        """The mapping is not needed for the benchmarks"""
+
+        return self.client._respond(  # pylint: disable=protected-access
+            {"benchmark": {"mappings": {"properties": {}}}}
+        )
+
+
+def _find_required_ids(query):
+    """Find the ids of an ids query that every matching document must satisfy"""
+
+    ((kind, clause),) = query.items()
+    if kind == "ids":
+        return clause["values"]
+    if kind == "constant_score":
+        return _find_required_ids(clause["filter"])
+    if kind != "bool":
+        return None
+    for name in ["filter", "must"]:
+        queries = clause.get(name, [])
+        for required in queries if isinstance(queries, list) else [queries]:
+            ids = _find_required_ids(required)
+            if ids is not None:
+                return ids
+    return None
+
+
+def _matches(query, document):
+    """Evaluate the filter clauses that the wrapper sends, scoring is not simulated"""
+
+    ((kind, clause),) = query.items()
+    if kind == "match_all":
+        return True
+    if kind == "constant_score":
+        return _matches(clause["filter"], document)
+    if kind == "bool":
+        return _matches_bool(clause, document)
+    if kind == "ids":
+        return document["_id"] in clause["values"]
+    if kind == "exists":
+        return _get_field(document, clause["field"]) is not None
+
+    ((field, condition),) = clause.items()
+    value = _get_field(document, field)
+    if value is None:
+        return False
+    if kind == "term":
+        return value == condition
+    if kind == "terms":
+        return value in condition
+    if kind == "range":
+        return all(
+            RANGE_OPERATORS[operator](value, bound)
+            for operator, bound in condition.items()
+        )
+    if kind == "wildcard":
+        return _wildcard_to_regex(condition["value"]).fullmatch(str(value)) is not None
+    raise ValueError(
+        "The fake cluster cannot evaluate {kind} queries".format(kind=kind)
+    )
+
+
+def _matches_bool(clause, document):
+    """Every filter and must clause matches, no must_not clause does, and one should clause does"""
+
+    def clauses(name):
+        value = clause.get(name, [])
+        return value if isinstance(value, list) else [value]
+
+    required = clauses("filter") + clauses("must")
+    if not all(_matches(query, document) for query in required):
+        return False
+    if any(_matches(query, document) for query in clauses("must_not")):
+        return False
+    optional = clauses("should")
+    return not optional or any(_matches(query, document) for query in optional)
+
+
+def _get_field(document, field):
+    """Read a dotted field from the source, where a keyword sub field is the field itself"""
+
+    value = document["_source"]
+    names = field.split(".")
+    if len(names) > 1 and names[-1] == "keyword":
+        names = names[:-1]
+    for name in names:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(name)
+    return value
+
+
+def _wildcard_to_regex(pattern):
+    """Translate an elasticsearch wildcard pattern, where a backslash escapes the next character"""
+
+    parts = []
+    for escaped, character in re.findall(r"\\(.)|(.)", pattern, re.DOTALL):
+        if escaped:
+            parts.append(re.escape(escaped))
+        elif character == "*":
+            parts.append(".*")
+        elif character == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(character))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def _slice(documents, clause):
+    """Keep the documents of the slice, partitioned by a stable hash of the id"""
+
+    return [
+        document
+        for document in documents
+        if zlib.crc32(document["_id"].encode("utf-8")) % clause["max"] == clause["id"]
+    ]
+
+
+def _get_hit_fields(filter_path):
+    if not filter_path:
+        return None
+    return {
+        path[len("hits.hits.") :]
+        for path in filter_path.split(",")
+        if path.startswith("hits.hits.")
+    }
+
+
+def _filter_source(source, fields):
+    if not isinstance(fields, list):
+        return source
+    return {key: value for key, value in source.items() if key in fields}
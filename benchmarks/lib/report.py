@@ -0,0 +1,69 @@
+"""Showing the benchmark results and comparing them against a baseline"""
+
+import json
+
+
+def show_results(results):
+    """Print a line for each scenario"""
+
+    for name, result in results.items():
+        stages = result["stages"]
+        print(
+            "{name:<14} {rows:>8} rows {rate:>12.0f} rows/s {seconds:>8.3f}s "
+            "(fdw {fdw:.3f}s, decode {decode:.3f}s, server {server:.3f}s) "
+            "{requests:>6} requests {peak:>10.0f} KiB peak".format(
+                name=name,
+                rows=result["rows"],
+                rate=result["rows_per_second"],
+                seconds=result["seconds"],
+                fdw=stages["fdw"],
+                decode=stages["decode"],
+                server=stages["server"],
+                requests=result["requests"],
+                peak=result["peak_kib"],
+            )
+        )
+
+
+def save_baseline(path, results):
+    """Store the results as the baseline"""
+
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """Read the stored baseline"""
+
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def compare_results(results, baseline, tolerance):
+    """Print the change in throughput against the baseline,
+    returning the scenarios that are slower than the tolerance allows"""
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print("{name:<14} not in the baseline".format(name=name))
+            continue
+        before = baseline[name]["rows_per_second"]
+        after = result["rows_per_second"]
+        change = after / before - 1.0 if before else 0.0
+        regressed = change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(
+            "{name:<14} {before:>12.0f} -> {after:>12.0f} rows/s {change:>+7.1%} "
+            "peak {peak_before:.0f} -> {peak_after:.0f} KiB{flag}".format(
+                name=name,
+                before=before,
+                after=after,
+                change=change,
+                peak_before=baseline[name]["peak_kib"],
+                peak_after=result["peak_kib"],
+                flag=" SLOWER" if regressed else "",
+            )
+        )
+    return regressions
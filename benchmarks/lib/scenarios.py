@@ -0,0 +1,199 @@
+"""The benchmark scenarios, each of which drives the foreign data wrapper against a fake cluster"""
+
+# pylint: disable=import-error, wrong-import-order
+
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+from multicorn import ColumnDefinition, Qual
+from pg_es_fdw import ElasticsearchFDW
+from pg_es_fdw.cache import COUNT_CACHE, RESULT_CACHE, STATISTICS_CACHE
+from pg_es_fdw.clients import CLIENTS
+from pg_es_fdw.options import ElasticsearchFDWOptions
+
+from lib.fake_elasticsearch import FakeElasticsearch
+
+Scenario = namedtuple("Scenario", ["name", "description", "size", "shape", "run"])
+
+NARROW_COLUMNS = [
+    ("id", "bigint"),
+    ("title", "text"),
+    ("body", "text"),
+    ("views", "integer"),
+    ("published", "timestamp without time zone"),
+]
+WIDE_COLUMNS = NARROW_COLUMNS + [("metadata", "jsonb")]
+
+
+def make_documents(count, shape):
+    """Create the deterministic documents of the shape"""
+
+    documents = []
+    for number in range(count):
+        source = {
+            "title": "Title {number}".format(number=number),
+            "body": "Body of document {number} ".format(number=number) * 8,
+            "views": number % 1000,
+            "published": "2020-01-{day:02d}T12:00:00".format(day=number % 28 + 1),
+        }
+        if shape == "wide":
+            source["metadata"] = {
+                "tags": [
+                    "tag{index}".format(index=(number + index) % 50)
+                    for index in range(5)
+                ],
+                "author": {
+                    "name": "Author {number}".format(number=number % 100),
+                    "id": number % 100,
+                },
+                "counts": {
+                    "field{index}".format(index=index): number * index
+                    for index in range(20)
+                },
+            }
+        documents.append({"_id": str(number), "_source": source})
+    return documents
+
+
+def get_columns(shape):
+    """The columns of the foreign table for the shape"""
+
+    columns = WIDE_COLUMNS if shape == "wide" else NARROW_COLUMNS
+    return [name for name, _ in columns]
+
+
+def make_table(shape, options):
+    """Create the foreign data wrapper for a table of the shape"""
+
+    columns = WIDE_COLUMNS if shape == "wide" else NARROW_COLUMNS
+    definitions = {
+        name: ColumnDefinition(name, type_name=type_name) for name, type_name in columns
+    }
+    table_options = {"index": "benchmark", "rowid_column": "id"}
+    table_options.update(options)
+    return ElasticsearchFDW(table_options, definitions)
+
+
+def run_scan(table, size, shape):  # pylint: disable=unused-argument
+    """Read every document"""
+
+    rows = sum(1 for _ in table.execute([], get_columns(shape)))
+    table.end_scan()
+    return rows
+
+
+def run_lookups(table, size, shape):
+    """Read documents one at a time by id"""
+
+    columns = get_columns(shape)
+    rows = 0
+    for number in range(size):
+        rows += sum(
+            1 for _ in table.execute([Qual("id", "=", (number * 7919) % size)], columns)
+        )
+        table.end_scan()
+    return rows
+
+
+def run_inserts(table, size, shape):  # pylint: disable=unused-argument
+    """Insert new documents, which are sent in bulk requests"""
+
+    for number in range(size):
+        table.insert(
+            {
+                "id": number,
+                "title": "Inserted {number}".format(number=number),
+                "body": "Inserted body {number} ".format(number=number) * 8,
+                "views": number % 1000,
+                "published": "2021-02-03T04:05:06",
+            }
+        )
+    table.end_modify()
+    return size
+
+
+SCENARIOS = [
+    Scenario("large-scan", "scan of narrow documents", 100000, "narrow", run_scan),
+    Scenario(
+        "wide-json",
+        "scan of documents with a nested jsonb column",
+        20000,
+        "wide",
+        run_scan,
+    ),
+    Scenario("point-lookups", "lookups by id", 2000, "narrow", run_lookups),
+    Scenario(
+        "bulk-insert", "inserts sent through the bulk api", 50000, "narrow", run_inserts
+    ),
+]
+
+
+@contextmanager
+def connected(client):
+    """Make every table use the fake cluster"""
+
+    def make_fake_client(options):
+        return client.connect(options)
+
+    make_client = ElasticsearchFDWOptions.make_client
+    ElasticsearchFDWOptions.make_client = make_fake_client
+    for cache in [CLIENTS, COUNT_CACHE, STATISTICS_CACHE, RESULT_CACHE]:
+        cache.clear()
+    try:
+        yield
+    finally:
+        ElasticsearchFDWOptions.make_client = make_client
+        CLIENTS.clear()
+
+
+def run_scenario(scenario, scale, latency, repeat, options):
+    """Run the scenario, returning the timings of the fastest run and the peak memory use"""
+
+    size = max(1, int(scenario.size * scale))
+    documents = (
+        [] if scenario.run is run_inserts else make_documents(size, scenario.shape)
+    )
+    client = FakeElasticsearch(documents, latency=latency)
+
+    with connected(client):
+        table = make_table(scenario.shape, options)
+        # The first run warms up the caches of the wrapper, as a long lived connection would
+        scenario.run(table, size, scenario.shape)
+
+        runs = []
+        for _ in range(repeat):
+            client.reset_timings()
+            started = time.perf_counter()
+            rows = scenario.run(table, size, scenario.shape)
+            seconds = time.perf_counter() - started
+            runs.append(
+                {
+                    "rows": rows,
+                    "seconds": seconds,
+                    "rows_per_second": rows / seconds if seconds else 0.0,
+                    "requests": client.requests,
+                    "stages": {
+                        "server": client.timings["server"],
+                        "decode": client.timings["decode"],
+                        "fdw": max(
+                            0.0,
+                            seconds
+                            - client.timings["server"]
+                            - client.timings["decode"],
+                        ),
+                    },
+                }
+            )
+        best = min(runs, key=lambda run: run["seconds"])
+
+        tracemalloc.start()
+        try:
+            scenario.run(table, size, scenario.shape)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        best["peak_kib"] = peak / 1024.0
+
+    return best
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Runs the benchmarks without PostgreSQL or Elasticsearch"""
+
+import argparse
+import sys
+from os.path import abspath, dirname, join
+
+BENCHMARK_FOLDER = dirname(abspath(__file__))
+PROJECT_FOLDER = dirname(BENCHMARK_FOLDER)
+# multicorn only exists within PostgreSQL so a stand in is used
+sys.path[:0] = [join(BENCHMARK_FOLDER, "shim"), PROJECT_FOLDER, BENCHMARK_FOLDER]
+
+# pylint: disable=wrong-import-position
+from lib.report import compare_results, load_baseline, save_baseline, show_results
+from lib.scenarios import SCENARIOS, run_scenario
+
+
+def main():
+    """Runs the benchmarks"""
+
+    names = [scenario.name for scenario in SCENARIOS]
+    parser = argparse.ArgumentParser(description="Benchmark the foreign data wrapper.")
+    parser.add_argument(
+        "--scenario", nargs="+", choices=names, default=names, help="Scenarios to run"
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplier for the number of documents",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Milliseconds that each request takes",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Timed runs of each scenario, the fastest is kept",
+    )
+    parser.add_argument(
+        "--option",
+        nargs="*",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Table options, for example serializer=json",
+    )
+    parser.add_argument(
+        "--save-baseline", metavar="PATH", help="Store the results as the baseline"
+    )
+    parser.add_argument(
+        "--baseline", metavar="PATH", help="Compare the results against the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Fraction of throughput that can be lost before failing",
+    )
+    args = parser.parse_args()
+
+    options = dict(option.split("=", 1) for option in args.option)
+    results = {}
+    for scenario in SCENARIOS:
+        if scenario.name not in args.scenario:
+            continue
+        results[scenario.name] = run_scenario(
+            scenario,
+            scale=args.scale,
+            latency=args.latency / 1000.0,
+            repeat=args.repeat,
+            options=options,
+        )
+    show_results(results)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.baseline:
+        regressions = compare_results(
+            results, load_baseline(args.baseline), args.tolerance
+        )
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""A stand in for the parts of multicorn that the foreign data wrapper uses.
+Multicorn is only importable inside PostgreSQL, so the benchmarks use this instead."""
+
+# pylint: disable=useless-object-inheritance, too-few-public-methods, too-many-arguments
+
+
+class ForeignDataWrapper(object):
+    """The base class of every foreign data wrapper"""
+
+    def __init__(self, options, columns):
+        self.options = options
+        self.columns = columns
+
+
+class Qual(object):
+    """A qualifier of the scan, the operator is a tuple of (operator, is_any) for lists"""
+
+    def __init__(self, field_name, operator, value):
+        self.field_name = field_name
+        self.operator = operator
+        self.value = value
+
+    @property
+    def is_list_operator(self):
+        """Test if the qualifier compares against a list of values"""
+        return isinstance(self.operator, tuple)
+
+    @property
+    def list_any_or_all(self):
+        """For list operators this is True for ANY and False for ALL"""
+        return self.operator[1] if self.is_list_operator else None
+
+
+class ColumnDefinition(object):
+    """The definition of a column of the foreign table"""
+
+    def __init__(self, column_name, type_name="text", base_type_name=None):
+        self.column_name = column_name
+        self.type_name = type_name
+        self.base_type_name = base_type_name or type_name
+
+
+class SortKey(object):
+    """A column that the scan is sorted by"""
+
+    def __init__(self, attname, attnum, is_reversed, nulls_first, collate=None):
+        self.attname = attname
+        self.attnum = attnum
+        self.is_reversed = is_reversed
+        self.nulls_first = nulls_first
+        self.collate = collate
@@ -0,0 +1,11 @@
+"""A stand in for the multicorn logging function"""
+
+import logging
+
+
+def log_to_postgres(message, level=logging.INFO, hint=None, detail=None):
+    """PostgreSQL aborts the statement on an error, which the benchmarks treat as a failure"""
+    # pylint: disable=unused-argument
+
+    if level >= logging.ERROR:
+        raise RuntimeError(message)
@@ -1,2 +1,3 @@
 """ Elastic Search foreign data wrapper """
 from .fdw import ElasticsearchFDW
+from .stats import ElasticsearchStatsFDW
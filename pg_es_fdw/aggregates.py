@@ -0,0 +1,310 @@
+"""
+Aggregation of the rows, either by elasticsearch aggregations or by the foreign data wrapper.
+Postgres does not check the rows of an aggregate that has been pushed down,
+so the aggregation must be exact.
+"""
+
+# pylint: disable=useless-object-inheritance, too-many-arguments
+
+import datetime
+import decimal
+
+from elasticsearch import VERSION as ELASTICSEARCH_VERSION
+
+# The aggregate functions that multicorn can push down
+AGGREGATE_FUNCTIONS = ["min", "max", "sum", "avg", "count", "count.*"]
+
+# The operators of the qualifiers that can be checked for aggregates
+# These are the operators that are translated into elasticsearch filters
+AGGREGATE_OPERATORS = ["=", "<>", "<", "<=", ">", ">=", "~~"]
+
+INTEGER_TYPES = {"SMALLINT", "INTEGER", "BIGINT"}
+FLOAT_TYPES = {"REAL", "DOUBLE PRECISION"}
+DATE_TYPES = {"DATE", "TIMESTAMP WITHOUT TIME ZONE", "TIMESTAMP WITH TIME ZONE"}
+# elasticsearch calculates the stats as doubles, which only hold these types exactly.
+# Sums of integers become inexact and postgres averages them as numeric,
+# so only the minimum and maximum of these types are calculated by elasticsearch.
+EXACT_STATS_TYPES = FLOAT_TYPES | DATE_TYPES | {"SMALLINT", "INTEGER"}
+# postgres orders text by the collation of the column, which is not the order of python strings
+TEXT_TYPES = {"TEXT", "CHARACTER VARYING", "CHARACTER", "NAME", "CITEXT"}
+
+
+def get_aggregate_functions(columns):
+    """
+    Get the aggregate functions that can be pushed down for the columns.
+    The minimum and maximum of text would be calculated in the wrong order,
+    so they are left to postgres when the table has text columns.
+    """
+    # (Columns) -> List[str]
+    if any(column.type_name in TEXT_TYPES for column in columns.columns):
+        return [name for name in AGGREGATE_FUNCTIONS if name not in {"min", "max"}]
+    return list(AGGREGATE_FUNCTIONS)
+
+
+class Aggregation(object):
+    """
+    The aggregates and group keys of a query, translated into elasticsearch aggregations.
+    Groups are read with a composite aggregation one page of buckets at a time.
+    """
+
+    def __init__(self, columns, aggs, group_clauses):
+        # (Columns, Dict[str, Dict[str, str]], List[str]) -> None
+        self.columns = columns
+        self.aggs = aggs
+        self.group_clauses = group_clauses
+        # elasticsearch restricts the characters in aggregation names so the names are generated
+        self.metric_names = {
+            alias: "a{index}".format(index=index) for index, alias in enumerate(aggs)
+        }
+        self.group_names = {
+            name: "g{index}".format(index=index)
+            for index, name in enumerate(group_clauses)
+        }
+
+    def get_read_columns(self):
+        """
+        Get the columns that are read to aggregate the rows without elasticsearch
+        """
+        # () -> Set[str]
+        names = set(self.group_clauses)
+        for aggregate in self.aggs.values():
+            if aggregate["function"] != "count.*":
+                names.add(aggregate["column"])
+        return names
+
+    @property
+    def is_pushable(self):
+        """
+        Test if elasticsearch can calculate every aggregate and group key exactly
+        """
+        # () -> bool
+        if self.group_clauses and tuple(ELASTICSEARCH_VERSION[:2]) < (6, 4):
+            # composite aggregations with missing buckets were introduced in 6.4
+            return False
+        for name in self.group_clauses:
+            column = self.columns.columns_by_name.get(name)
+            if column is None or column.filter_field is None:
+                return False
+        for aggregate in self.aggs.values():
+            if self._get_metric(aggregate) is None and not self._is_doc_count(
+                aggregate
+            ):
+                return False
+        return True
+
+    def search(self, client, options, arguments):
+        """
+        Generate the aggregated rows from elasticsearch aggregations
+        """
+        # (Elasticsearch, ElasticsearchFDWOptions, Dict[str, Any]) -> Iterator[Dict[str, Any]]
+        arguments = arguments.copy()
+        body = dict(arguments.get("body") or {})
+        body["size"] = 0
+        body.pop("track_scores", None)
+        metrics = {
+            self.metric_names[alias]: self._get_metric(aggregate)
+            for alias, aggregate in self.aggs.items()
+            if not self._is_doc_count(aggregate)
+        }
+
+        if not self.group_clauses:
+            if ELASTICSEARCH_VERSION[0] >= 6:
+                body["track_total_hits"] = True
+            if metrics:
+                body["aggs"] = metrics
+            arguments["body"] = body
+            response = client.search(**arguments)
+            total = response["hits"]["total"]
+            if isinstance(total, dict):
+                total = total["value"]
+            yield self._to_row({}, total, response.get("aggregations", {}))
+            return
+
+        body.pop("track_total_hits", None)
+        sources = [
+            {
+                self.group_names[name]: {
+                    "terms": {
+                        "field": self.columns.columns_by_name[name].filter_field,
+                        "missing_bucket": True,
+                    }
+                }
+            }
+            for name in self.group_clauses
+        ]
+        composite = {"size": options.scroll_size, "sources": sources}
+        body["aggs"] = {"groups": {"composite": composite}}
+        if metrics:
+            body["aggs"]["groups"]["aggs"] = metrics
+        arguments["body"] = body
+
+        while True:
+            response = client.search(**arguments)
+            groups = response.get("aggregations", {}).get("groups", {})
+            buckets = groups.get("buckets", [])
+            for bucket in buckets:
+                yield self._to_row(bucket["key"], bucket["doc_count"], bucket)
+
+            if len(buckets) < options.scroll_size:
+                return
+            # The after key was introduced in 6.3, before that it is the last key
+            composite["after"] = groups.get("after_key") or buckets[-1]["key"]
+
+    def _to_row(self, key, doc_count, aggregations):
+        # (Dict[str, Any], int, Dict[str, Any]) -> Dict[str, Any]
+        row = {}
+        for name in self.group_clauses:
+            column = self.columns.columns_by_name[name]
+            row[name] = _convert(column.type_name, key.get(self.group_names[name]))
+
+        for alias, aggregate in self.aggs.items():
+            if self._is_doc_count(aggregate):
+                row[alias] = doc_count
+                continue
+            result = aggregations[self.metric_names[alias]]
+            function = aggregate["function"]
+            if function == "count":
+                row[alias] = int(result["value"])
+            elif not result.get("count"):
+                # postgres returns NULL when there are no values to aggregate
+                row[alias] = None
+            else:
+                column = self.columns.columns_by_name[aggregate["column"]]
+                value = result[function]
+                if function in {"min", "max"}:
+                    value = _convert(column.type_name, value)
+                row[alias] = value
+        return row
+
+    def _is_doc_count(self, aggregate):
+        """
+        Test if the aggregate is the number of documents
+        """
+        # (Dict[str, str]) -> bool
+        return (
+            aggregate["function"] == "count.*"
+            or aggregate["function"] == "count"
+            and aggregate["column"] == self.columns.id_column.name
+        )
+
+    def _get_metric(self, aggregate):
+        """
+        Get the elasticsearch aggregation that calculates the aggregate, if there is one
+        """
+        # (Dict[str, str]) -> Optional[Dict[str, Any]]
+        column = self.columns.columns_by_name.get(aggregate.get("column"))
+        if column is None or column.filter_field is None:
+            return None
+        function = aggregate["function"]
+        if function == "count":
+            return {"value_count": {"field": column.filter_field}}
+        if function in {"sum", "avg"} and column.type_name in FLOAT_TYPES:
+            return {"stats": {"field": column.filter_field}}
+        if function in {"min", "max"} and column.type_name in EXACT_STATS_TYPES:
+            return {"stats": {"field": column.filter_field}}
+        return None
+
+
+def aggregate_rows(rows, aggs, group_clauses):
+    """
+    Aggregate the rows, for when elasticsearch cannot calculate the aggregates exactly
+    """
+    # (Iterable[Dict[str, Any]], Dict[str, Dict[str, str]], List[str]) -> Iterator[Dict[str, Any]]
+    groups = {}
+    for row in rows:
+        key = tuple(row.get(name) for name in group_clauses)
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = {alias: _State() for alias in aggs}
+        for alias, aggregate in aggs.items():
+            if aggregate["function"] == "count.*":
+                states[alias].add(True)
+            else:
+                states[alias].add(row.get(aggregate["column"]))
+
+    if not groups and not group_clauses:
+        # an aggregate without groups returns a row even when there are no rows
+        groups[()] = {alias: _State() for alias in aggs}
+
+    for key, states in groups.items():
+        row = dict(zip(group_clauses, key))
+        for alias, aggregate in aggs.items():
+            row[alias] = states[alias].get(aggregate["function"])
+        yield row
+
+
+class _State(object):
+    """
+    The running aggregate of the values of one column in one group
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = None
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        """
+        Add a value of the column, values that are NULL are not aggregated
+        """
+        # (Any) -> None
+        if value is None:
+            return
+        self.count += 1
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if isinstance(value, (int, float, decimal.Decimal)) and not isinstance(
+            value, bool
+        ):
+            self.total = value if self.total is None else self.total + value
+
+    def get(self, function):
+        """
+        Get the aggregate of the values.
+        The average of integers is numeric, as it is in postgres.
+        """
+        # (str) -> Any
+        if function in {"count", "count.*"}:
+            return self.count
+        if function in {"min", "max"}:
+            return self.minimum if function == "min" else self.maximum
+        if function == "sum" or self.total is None:
+            return self.total
+        if isinstance(self.total, float):
+            return self.total / self.count
+        return decimal.Decimal(self.total) / self.count
+
+
+def _convert(type_name, value):
+    """
+    Convert an aggregated elasticsearch value to the postgres type.
+    Dates are aggregated as milliseconds since the epoch.
+    """
+    # (Optional[str], Any) -> Any
+    if value is None:
+        return None
+    if type_name in INTEGER_TYPES:
+        return int(value)
+    if type_name == "BOOLEAN":
+        return bool(value)
+    if type_name in DATE_TYPES and isinstance(value, (int, float)):
+        return _convert_date(type_name, value)
+    return value
+
+
+def _convert_date(type_name, value):
+    """
+    Convert milliseconds since the epoch to the postgres date or timestamp type
+    """
+    # (str, Union[int, float]) -> Union[datetime.date, datetime.datetime]
+    timestamp = datetime.datetime.fromtimestamp(
+        value / 1000.0, tz=datetime.timezone.utc
+    )
+    if type_name == "DATE":
+        return timestamp.date()
+    if type_name == "TIMESTAMP WITHOUT TIME ZONE":
+        return timestamp.replace(tzinfo=None)
+    return timestamp
@@ -0,0 +1,332 @@
+"""
+Buffers writes to elasticsearch and sends them in batches through the bulk api.
+"""
+
+# pylint: disable=useless-object-inheritance
+
+from collections import OrderedDict, namedtuple
+
+from .engine import submit
+
+
+class BulkWriter(object):
+    """
+    Accumulates index, update and delete actions and sends them in bulk requests.
+    A batch is sent when it reaches the configured number of actions or bytes,
+    and the remaining actions are sent when the writer is finished.
+    """
+
+    def __init__(self, get_client, options):
+        # (Callable[[], Elasticsearch], ElasticsearchFDWOptions) -> None
+        # The client is looked up for each request as idle clients are dropped
+        self.get_client = get_client
+        self.options = options
+        self.lines = []
+        self.actions = 0
+        self.size = 0
+        # The batch that has been sent but not checked yet.
+        # An async client builds the next batch while this is in flight.
+        self.pending = None
+        # Tracks if a batch has been sent without a refresh since the writer was last finished
+        self.unrefreshed = False
+
+    @property
+    def is_empty(self):
+        """
+        Test if there are no actions waiting to be sent
+        """
+        # () -> bool
+        return not self.lines and self.pending is None
+
+    def index(self, document_id, document):
+        """
+        Add an action that indexes the whole document
+        """
+        # (Any, Dict[str, Any]) -> None
+        self._add({"index": {"_id": str(document_id)}}, document)
+
+    def update(self, document_id, document):
+        """
+        Add an action that updates the fields of the document
+        """
+        # (Any, Dict[str, Any]) -> None
+        self._add({"update": {"_id": str(document_id)}}, {"doc": document})
+
+    def delete(self, document_id):
+        """
+        Add an action that deletes the document
+        """
+        # (Any) -> None
+        self._add({"delete": {"_id": str(document_id)}}, None)
+
+    def flush(self, refresh="false"):
+        """
+        Send the waiting actions in a single bulk request, without waiting for it.
+        The previous batch is checked first, only one batch is in flight at a time.
+        Raises a ValueError describing the failed actions if any fail.
+        """
+        # (str) -> None
+        if not self.lines:
+            return
+
+        body = "\n".join(self.lines) + "\n"
+        self._reset()
+        self.wait()
+        self.pending = submit(
+            self.get_client().bulk, body=body, refresh=refresh, **self.options.arguments
+        )
+        self.unrefreshed = refresh == "false"
+
+    def finish(self):
+        """
+        Send the waiting actions, refreshing the index if the options require it.
+        The refresh happens once for all of the batches sent since the writer was last finished.
+        A bulk refresh only covers the shards of its own batch,
+        so after earlier batches the index is refreshed separately.
+        """
+        # () -> None
+        if self.lines and not self.unrefreshed:
+            self.flush(refresh=self.options.refresh)
+        else:
+            self.flush()
+            if self.unrefreshed and self.options.refresh != "false":
+                self.wait()
+                self.get_client().indices.refresh(
+                    index=self.options.arguments["index"]
+                )
+        self.wait()
+        self.unrefreshed = False
+
+    def clear(self):
+        """
+        Discard the waiting actions, and stop checking any batch in flight
+        """
+        # () -> None
+        self._reset()
+        self.pending = None
+
+    def wait(self):
+        """
+        Wait for the batch in flight to be written.
+        Raises a ValueError describing the failed actions if any fail.
+        """
+        # () -> None
+        if self.pending is None:
+            return
+        pending, self.pending = self.pending, None
+        response = pending.result()
+        if response.get("errors"):
+            raise ValueError(_describe_failures(self.options.path, response["items"]))
+
+    def _reset(self):
+        # () -> None
+        self.lines = []
+        self.actions = 0
+        self.size = 0
+
+    def _add(self, action, source):
+        # (Dict[str, Any], Optional[Dict[str, Any]]) -> None
+        dumps = self.options.serializer.dumps
+        lines = [dumps(action)]
+        if source is not None:
+            lines.append(dumps(source))
+        self.lines.extend(lines)
+        self.actions += 1
+        self.size += sum(len(line) + 1 for line in lines)
+
+        if (
+            self.actions >= self.options.bulk_size
+            or self.size >= self.options.bulk_max_bytes
+        ):
+            self.flush()
+
+
+LogEntry = namedtuple("LogEntry", ["action", "document", "existed"])
+
+
+class WriteLog(object):
+    """
+    Merges the writes to each document made within a transaction.
+    An index followed by updates becomes a single index,
+    and any write followed by a delete becomes a delete.
+    A document that is indexed and then deleted within the transaction is never written.
+    The merged writes are passed to the bulk writer when the log is flushed.
+    """
+
+    def __init__(self, writer, max_size):
+        # (BulkWriter, int) -> None
+        self.writer = writer
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.savepoints = []
+
+    @property
+    def is_empty(self):
+        """
+        Test if there are no writes waiting to be sent
+        """
+        # () -> bool
+        return not self.entries and self.writer.is_empty
+
+    def index(self, document_id, document):
+        """
+        Record that the whole document is indexed
+        """
+        # (Any, Dict[str, Any]) -> None
+        key = str(document_id)
+        previous = self.entries.pop(key, None)
+        existed = previous.existed if previous is not None else False
+        self._add(key, LogEntry("index", document, existed))
+
+    def update(self, document_id, document):
+        """
+        Record that the fields of the document are updated
+        """
+        # (Any, Dict[str, Any]) -> None
+        key = str(document_id)
+        previous = self.entries.pop(key, None)
+        if previous is None or previous.action == "delete":
+            entry = LogEntry("update", document, True)
+        else:
+            merged = dict(previous.document)
+            merged.update(document)
+            entry = LogEntry(previous.action, merged, previous.existed)
+        self._add(key, entry)
+
+    def delete(self, document_id):
+        """
+        Record that the document is deleted
+        """
+        # (Any) -> None
+        key = str(document_id)
+        previous = self.entries.pop(key, None)
+        if previous is None or previous.existed:
+            self._add(key, LogEntry("delete", None, True))
+
+    def overlay(self, pages, ids):
+        """
+        Apply the waiting writes for the ids to the pages of a search for those ids.
+        Indexed documents are returned from the log and deleted documents are removed.
+        """
+        # (Iterator[List[Dict[str, Any]]], Iterable[str]) -> Iterator[List[Dict[str, Any]]]
+        entries = {key: self.entries[key] for key in ids if key in self.entries}
+        for hits in pages:
+            overlaid = []
+            for hit in hits:
+                entry = entries.get(hit["_id"])
+                if entry is None:
+                    overlaid.append(hit)
+                elif entry.action == "update":
+                    source = dict(hit.get("_source", {}))
+                    source.update(entry.document)
+                    overlaid.append(dict(hit, _source=source))
+            yield overlaid
+
+        yield [
+            {"_id": key, "_score": None, "_source": entry.document}
+            for key, entry in entries.items()
+            if entry.action == "index"
+        ]
+
+    def flush(self):
+        """
+        Send the merged writes without refreshing the index
+        """
+        # () -> None
+        self._drain()
+        self.writer.flush()
+
+    def wait(self):
+        """
+        Wait for the merged writes that were sent to be written
+        """
+        # () -> None
+        self.writer.wait()
+
+    def _drain(self):
+        """
+        Pass the merged writes to the bulk writer
+        """
+        # () -> None
+        entries = self.entries
+        self.entries = OrderedDict()
+        for key, entry in entries.items():
+            if entry.action == "index":
+                self.writer.index(key, entry.document)
+            elif entry.action == "update":
+                self.writer.update(key, entry.document)
+            else:
+                self.writer.delete(key)
+
+    def finish(self):
+        """
+        Send the merged writes, refreshing the index if the options require it
+        """
+        # () -> None
+        self._drain()
+        self.writer.finish()
+
+    def clear(self):
+        """
+        Discard the waiting writes
+        """
+        # () -> None
+        self.entries = OrderedDict()
+        self.savepoints = []
+        self.writer.clear()
+
+    def savepoint(self):
+        """
+        Remember the waiting writes so that a subtransaction can be rolled back
+        """
+        # () -> None
+        self.savepoints.append(self.entries.copy())
+
+    def release(self):
+        """
+        Forget the most recent savepoint as the subtransaction committed
+        """
+        # () -> None
+        if self.savepoints:
+            self.savepoints.pop()
+
+    def rollback_to(self):
+        """
+        Restore the waiting writes from the most recent savepoint.
+        Writes that have already been sent cannot be undone.
+        """
+        # () -> None
+        if self.savepoints:
+            self.entries = self.savepoints.pop()
+
+    def _add(self, key, entry):
+        # (str, LogEntry) -> None
+        self.entries[key] = entry
+        if len(self.entries) >= self.max_size:
+            self._drain()
+
+
+def _describe_failures(path, items):
+    """
+    Describe the failed actions from the bulk response
+    """
+    # (str, List[Dict[str, Dict[str, Any]]]) -> str
+    failures = []
+    for item in items:
+        for action, result in item.items():
+            error = result.get("error")
+            if error is None:
+                continue
+            if isinstance(error, dict):
+                error = "{type}: {reason}".format(
+                    type=error.get("type"), reason=error.get("reason")
+                )
+            failures.append(
+                "{action} for {path}/{document_id} failed: {error}".format(
+                    action=action.upper(),
+                    path=path,
+                    document_id=result.get("_id"),
+                    error=error,
+                )
+            )
+    return "; ".join(failures)
@@ -0,0 +1,133 @@
+"""
+Process wide caches.
+Each postgres backend is a separate process, so these are never shared between connections.
+"""
+
+# pylint: disable=useless-object-inheritance
+
+import json
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """
+    A least recently used cache where every entry expires after a time to live.
+    The size is the total weight of the entries, each of which weighs one unless told otherwise.
+    """
+
+    def __init__(self, max_size):
+        # (int) -> None
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        """
+        Get the unexpired value for the key, or None if it is missing
+        """
+        # (Hashable) -> Optional[Any]
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value, weight = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            self.size -= weight
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl, weight=1):
+        """
+        Store the value for the key for ttl seconds
+        """
+        # (Hashable, Any, float, int) -> None
+        if ttl <= 0 or weight > self.max_size:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[2]
+        self.entries[key] = (time.monotonic() + ttl, value, weight)
+        self.size += weight
+        while self.size > self.max_size:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+
+    def clear(self):
+        """
+        Remove every entry
+        """
+        # () -> None
+        self.entries.clear()
+        self.size = 0
+
+
+class ResultCache(object):
+    """
+    Caches the rows of queries, bounded by the total number of rows held.
+    Writes to an index invalidate the cached rows for it by moving the index to a new generation,
+    which is part of every key, and the old entries are evicted as they age.
+    """
+
+    def __init__(self, max_rows):
+        # (int) -> None
+        self.cache = TTLCache(max_size=max_rows)
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, key):
+        """
+        Get the unexpired rows for the query against the index, or None if they are missing
+        """
+        # (str, str) -> Optional[List[Any]]
+        rows = self.cache.get(self._make_key(path, key))
+        if rows is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return rows
+
+    def set(self, path, key, rows, ttl):
+        """
+        Store the rows for the query against the index for ttl seconds
+        """
+        # (str, str, List[Any], float) -> None
+        self.cache.set(
+            self._make_key(path, key), rows, ttl=ttl, weight=max(1, len(rows))
+        )
+
+    def invalidate(self, path):
+        """
+        Forget the rows for every query against the index
+        """
+        # (str) -> None
+        self.generations[path] = self.generations.get(path, 0) + 1
+
+    def clear(self):
+        """
+        Remove every entry
+        """
+        # () -> None
+        self.cache.clear()
+        self.generations.clear()
+
+    def _make_key(self, path, key):
+        # (str, str) -> Tuple[str, int, str]
+        return (path, self.generations.get(path, 0), key)
+
+
+def make_key(*parts):
+    """
+    Create a cache key from json serializable parts
+    """
+    # (*Any) -> str
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+COUNT_CACHE = TTLCache(max_size=1024)
+STATISTICS_CACHE = TTLCache(max_size=256)
+RESULT_CACHE = ResultCache(max_rows=100000)
+# The page sizes learned by adaptive paging
+PAGE_SIZE_CACHE = TTLCache(max_size=1024)
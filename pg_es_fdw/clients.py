@@ -0,0 +1,97 @@
+"""
+Process wide registry of elasticsearch clients.
+Tables that connect to the same cluster with the same settings share a client,
+and so share its connection pool.
+"""
+
+# pylint: disable=useless-object-inheritance, broad-except
+
+import time
+from collections import Counter
+
+
+class ClientRegistry(object):
+    """
+    Holds the elasticsearch clients by the settings used to create them.
+    A client that has not been used for the idle timeout of its table is closed,
+    unless a scan is still holding it.
+    """
+
+    def __init__(self):
+        # () -> None
+        self.clients = {}
+        # The number of running scans using each client
+        self.holds = Counter()
+
+    def get(self, key, options):
+        """
+        Get the client for the key, creating it from the options if required
+        """
+        # (str, ElasticsearchFDWOptions) -> Elasticsearch
+        now = time.monotonic()
+        self._evict(now)
+
+        entry = self.clients.get(key)
+        if entry is None:
+            client = options.make_client()
+        else:
+            client = entry[0]
+        self.clients[key] = (client, now, options.client_idle_timeout)
+        return client
+
+    def hold(self, key, options):
+        """
+        Get the client for the key, which is not closed until it is released
+        """
+        # (str, ElasticsearchFDWOptions) -> Elasticsearch
+        client = self.get(key, options)
+        self.holds[key] += 1
+        return client
+
+    def release(self, key):
+        """
+        Release a client that was held, so it can be closed once it is idle
+        """
+        # (str) -> None
+        self.holds[key] -= 1
+        if self.holds[key] <= 0:
+            del self.holds[key]
+
+    def clear(self):
+        """
+        Close and drop every client
+        """
+        # () -> None
+        clients = [client for client, _, _ in self.clients.values()]
+        self.clients.clear()
+        self.holds.clear()
+        for client in clients:
+            _close(client)
+
+    def _evict(self, now):
+        # (float) -> None
+        for key, (client, last_used, idle_timeout) in list(self.clients.items()):
+            if key not in self.holds and now - last_used > idle_timeout:
+                del self.clients[key]
+                _close(client)
+
+
+def _close(client):
+    """
+    Close the connections of the client.
+    Clients before elasticsearch 7 are closed through their transport.
+    """
+    # (Union[Elasticsearch, EngineClient]) -> None
+    close = getattr(client, "close", None)
+    if close is None:
+        close = getattr(getattr(client, "transport", None), "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        # The connections are dropped with the client anyway
+        pass
+
+
+CLIENTS = ClientRegistry()
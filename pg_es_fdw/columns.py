@@ -2,15 +2,31 @@
 Handlers for different column types
 """
 
-# pylint: disable=useless-object-inheritance, too-many-arguments
+# pylint: disable=useless-object-inheritance, too-many-arguments, too-few-public-methods
 
-import json
 import logging
 from abc import ABCMeta, abstractmethod
 
 from multicorn.utils import \
     log_to_postgres as log2pg  # pylint: disable=import-error
 
+from .serializer import RawSource
+
+# These types have the same comparison semantics in postgres and elasticsearch.
+# Text types are only filtered when they are mapped to keyword fields.
+FILTERABLE_TYPES = {
+    "SMALLINT",
+    "INTEGER",
+    "BIGINT",
+    "REAL",
+    "DOUBLE PRECISION",
+    "NUMERIC",
+    "BOOLEAN",
+    "DATE",
+    "TIMESTAMP WITHOUT TIME ZONE",
+    "TIMESTAMP WITH TIME ZONE",
+}
+
 
 class Column(object):
     """
@@ -19,24 +35,20 @@ class Column(object):
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, name):
-        # (str) -> None
+    def __init__(self, name, filter_field=None, is_keyword=False, type_name=None):
+        # (str, Optional[str], bool, Optional[str]) -> None
         self.name = name
-
-    def _value(self, row):
-        """
-        Get the named value from the elasticsearch response
-        """
-        return row["_source"][self.name]
-
-    @abstractmethod
-    def deserialize(self, row):
-        """
-        Convert the value from the elasticsearch representation to the postgres representation
-        """
-        # (Dict[str, Any]) -> Optional[Any]
-        # this is called when reading from elasticsearch
-        # the response is the result of an elasticsearch client query
+        # The elasticsearch field used when filtering or sorting on this column.
+        # When this is None the qualifiers for this column are not pushed down.
+        self.filter_field = filter_field
+        # Keyword fields are compared bytewise by elasticsearch
+        self.is_keyword = is_keyword
+        # The upper case postgres type, used to convert aggregated values
+        self.type_name = type_name
+
+    # Converts a document value to the postgres representation when reading.
+    # None means the value is used as it is.
+    convert = None
 
     @abstractmethod
     def serialize(self, value):
@@ -52,9 +64,6 @@ class IdColumn(Column):
     The handler for the elasticsearch document id
     """
 
-    def deserialize(self, row):
-        return row["_id"]
-
     def serialize(self, value):
         raise AssertionError("The id column is not serialized into the body")
 
@@ -64,9 +73,6 @@ class ScoreColumn(Column):
     The handler for the elasticsearch search score
     """
 
-    def deserialize(self, row):
-        return row["_score"]
-
     def serialize(self, value):
         raise AssertionError("The score column is not serialized into the body")
 
@@ -76,23 +82,96 @@ class BasicColumn(Column):
     The handler for types that share representations between elasticsearch and postgres
     """
 
-    def deserialize(self, row):
-        return self._value(row)
-
     def serialize(self, value):
         return value
 
 
 class JsonColumn(Column):
     """
-    The handler for JSON and JSONB columns
+    The handler for JSON and JSONB columns.
+    Undecoded document sources provide the json text directly.
     """
 
-    def deserialize(self, row):
-        return json.dumps(self._value(row))
+    def __init__(self, name, serializer):
+        # (str, Union[StandardSerializer, SimdjsonSerializer]) -> None
+        super(JsonColumn, self).__init__(name)
+        self.convert = serializer.to_raw
+        self.loads = serializer.loads
 
     def serialize(self, value):
-        return json.loads(value)
+        return self.loads(value)
+
+
+class RowProjector(object):
+    """
+    Converts elasticsearch hits into postgres rows for one scan.
+    The work of deciding which columns are requested and where they go is done once,
+    so each hit only touches the requested fields.
+    The rows are lists in postgres column order, as multicorn accepts sequences.
+    """
+
+    def __init__(
+        self, order, id_position, score_position, fields, json_fields, template
+    ):
+        # (List[str], Optional[int], Optional[int],
+        #  List[Tuple[int, str, Optional[Callable]]], List[Tuple[int, str, Callable]],
+        #  List[Any]) -> None
+        self.order = order
+        self.id_position = id_position
+        self.score_position = score_position
+        self.fields = fields
+        # Json columns are read as text from undecoded sources
+        self.json_fields = json_fields
+        self.template = template
+        # The positions that are included in the dict form of a row
+        self.positions = [
+            position
+            for position in [id_position, score_position]
+            + [field[0] for field in fields + json_fields]
+            if position is not None
+        ] + [
+            position
+            for position, value in enumerate(template)
+            if value is not None
+        ]
+
+    def project(self, hit):
+        """
+        Convert the hit into a row.
+        The columns that were not requested or are missing are NULL.
+        """
+        # (Dict[str, Any]) -> List[Any]
+        row = list(self.template)
+        if self.id_position is not None:
+            row[self.id_position] = hit["_id"]
+        if self.score_position is not None:
+            row[self.score_position] = hit.get("_score")
+        source = hit.get("_source", _EMPTY_SOURCE)
+        for position, name, convert in self.fields:
+            if name in source:
+                value = source[name]
+                row[position] = value if convert is None else convert(value)
+        if self.json_fields:
+            if isinstance(source, RawSource):
+                for position, name, _ in self.json_fields:
+                    if name in source:
+                        row[position] = source.raw(name)
+            else:
+                for position, name, convert in self.json_fields:
+                    if name in source:
+                        row[position] = convert(source[name])
+        return row
+
+    def as_dict(self, row):
+        """
+        Convert a projected row into a dict of the requested columns
+        """
+        # (List[Any]) -> Dict[str, Any]
+        order = self.order
+        return {order[position]: row[position] for position in self.positions}
+
+
+_EMPTY_SOURCE = {}
 
 
 class Columns(object):
@@ -101,14 +180,18 @@ class Columns(object):
     The elasticsearch table is never queried for the structure, it is assumed to be compatible.
     """
 
-    def __init__(self, id_column, score_column, query_column, sort_column, columns):
-        # (Column, Optional[Column], Optional[str], Optional[str], List[Column]) -> None
+    def __init__(
+        self, id_column, score_column, query_column, sort_column, columns, order
+    ):
+        # (Column, Optional[Column], Optional[str], Optional[str], List[Column], List[str]) -> None
         self.id_column = id_column
         self.score_column = score_column
         self.query_column = query_column
         self.sort_column = sort_column
         self.columns = columns
         self.columns_by_name = {column.name: column for column in columns}
+        # The names of all of the postgres columns in table order
+        self.order = order
 
     def has_id(self, data):
         """
@@ -117,27 +200,141 @@ class Columns(object):
         # (Dict[str, Any]) -> bool
         return self.id_column.name in data
 
-    def deserialize(self, row, query, sort, columns):
+    def get_source_fields(self, columns):
         """
-        Deserialize the requested columns into the postgres format from the elasticsearch response
+        Get the elasticsearch document fields that are needed to deserialize the requested columns.
+        The id and score columns are not part of the document.
         """
-        # (Dict[str, Any], Optional[str], Optional[str], Optional[List[str]]) -> Dict[str, Any]
-        if columns is not None:
-            columns = set(columns)
+        # (Optional[Iterable[str]]) -> Optional[List[str]]
+        if columns is None:
+            return None
+        columns = set(columns)
+        return [column.name for column in self.columns if column.name in columns]
 
-        data = {}
-        for column in [self.id_column, self.score_column] + self.columns:
-            if columns is None:
-                data[column.name] = column.deserialize(row)
-            elif column.name in columns:
-                data[column.name] = column.deserialize(row)
+    def get_hit_fields(self, columns, score):
+        """
+        Get the fields of each search hit that are needed to deserialize the requested columns.
+        The sort values are needed to page through the search with search_after.
+        """
+        # (Optional[Iterable[str]], bool) -> List[str]
+        fields = ["_id", "sort"]
+        if score:
+            fields.append("_score")
+        source_fields = self.get_source_fields(columns)
+        if source_fields is None or source_fields:
+            fields.append("_source")
+        return fields
+
+    def is_score_requested(self, columns, sortkeys):
+        """
+        Test if the score column is requested or sorted by
+        """
+        # (Optional[Iterable[str]], Optional[List[multicorn.SortKey]]) -> bool
+        if self.score_column is None:
+            return False
+        name = self.score_column.name
+        if columns is None or name in columns:
+            return True
+        return any(sortkey.attname == name for sortkey in sortkeys or [])
+
+    def is_complete(self, data):
+        """
+        Test if the postgres data has a value for the id and every document column
+        """
+        # (Dict[str, Any]) -> bool
+        return self.has_id(data) and all(
+            column.name in data for column in self.columns
+        )
 
-        if query:
-            data[self.query_column] = query
-        if sort:
-            data[self.sort_column] = sort
+    def can_sort(self, sortkey):
+        """
+        Test if elasticsearch can sort by the multicorn sort key.
+        Keyword fields are only sorted when postgres compares bytewise, as elasticsearch does.
+        """
+        # (multicorn.SortKey) -> bool
+        if (
+            self.score_column is not None
+            and sortkey.attname == self.score_column.name
+        ):
+            return True
+        column = self.columns_by_name.get(sortkey.attname)
+        if column is None or column.filter_field is None:
+            return False
+        if column.is_keyword:
+            return sortkey.collate in {"C", "POSIX"}
+        return True
+
+    def get_sort_clause(self, sortkeys):
+        """
+        Convert the multicorn sort keys into an elasticsearch sort clause
+        """
+        # (List[multicorn.SortKey]) -> List[Dict[str, Any]]
+        clause = []
+        for sortkey in sortkeys:
+            order = "desc" if sortkey.is_reversed else "asc"
+            if (
+                self.score_column is not None
+                and sortkey.attname == self.score_column.name
+            ):
+                clause.append({"_score": {"order": order}})
+                continue
+            field = self.columns_by_name[sortkey.attname].filter_field
+            missing = "_first" if sortkey.nulls_first else "_last"
+            clause.append({field: {"order": order, "missing": missing}})
+        return clause
+
+    def make_projector(self, columns, query, sort):
+        """
+        Create the projector that converts hits into rows with the requested columns.
+        The query and sort values are the same for every row of the scan.
+        """
+        # (Optional[Iterable[str]], Optional[str], Optional[str]) -> RowProjector
+        requested = None if columns is None else set(columns)
+        positions = {name: position for position, name in enumerate(self.order)}
+
+        def position_of(column):
+            # (Optional[Column]) -> Optional[int]
+            if column is None or column.name not in positions:
+                return None
+            if requested is not None and column.name not in requested:
+                return None
+            return positions[column.name]
+
+        requested_columns = [
+            column for column in self.columns if position_of(column) is not None
+        ]
+        fields = [
+            (positions[column.name], column.name, column.convert)
+            for column in requested_columns
+            if not isinstance(column, JsonColumn)
+        ]
+        json_fields = [
+            (positions[column.name], column.name, column.convert)
+            for column in requested_columns
+            if isinstance(column, JsonColumn)
+        ]
+        template = [None] * len(self.order)
+        if query and self.query_column in positions:
+            template[positions[self.query_column]] = query
+        if sort and self.sort_column in positions:
+            template[positions[self.sort_column]] = sort
+
+        return RowProjector(
+            order=self.order,
+            id_position=position_of(self.id_column),
+            score_position=position_of(self.score_column),
+            fields=fields,
+            json_fields=json_fields,
+            template=template,
+        )
 
-        return data
+    def deserialize(self, row, query, sort, columns):
+        """
+        Deserialize the requested columns into the postgres format from the elasticsearch response
+        """
+        # (Dict[str, Any], Optional[str], Optional[str], Optional[List[str]]) -> Dict[str, Any]
+        projector = self.make_projector(columns, query, sort)
+        return projector.as_dict(projector.project(row))
 
     def serialize(self, row):
         """
@@ -183,6 +380,7 @@ def make_columns(options, columns):
     Create a Columns object from the options and columns used to initialize the fdw
     """
     # (ElasticsearchFDWOptions, Dict[str, multicorn.ColumnDefinition]) -> Columns
+    order = list(columns)
     columns = columns.copy()
 
     id_column = IdColumn(name=options.rowid_column)
@@ -210,6 +408,7 @@ def make_columns(options, columns):
         query_column=query_column,
         sort_column=sort_column,
         columns=columns,
+        order=order,
     )
 
 
@@ -224,6 +423,16 @@ def make_column(options, name, column):
         options.query_column,
     }, "Programmer error: bad name passed to make_column {name}".format(name=name)
 
-    if column.base_type_name.upper() in {"JSON", "JSONB"}:
-        return JsonColumn(name=name)
-    return BasicColumn(name=name)
+    type_name = column.base_type_name.upper()
+    if type_name in {"JSON", "JSONB"}:
+        return JsonColumn(name=name, serializer=options.serializer)
+    if name in options.keyword_columns:
+        return BasicColumn(
+            name=name,
+            filter_field=options.keyword_columns[name],
+            is_keyword=True,
+            type_name=type_name,
+        )
+    if type_name in FILTERABLE_TYPES:
+        return BasicColumn(name=name, filter_field=name, type_name=type_name)
+    return BasicColumn(name=name, type_name=type_name)
@@ -0,0 +1,145 @@
+"""
+Runs elasticsearch requests on an asyncio event loop in a background thread.
+This allows independent requests to be in flight at the same time without a thread per request.
+"""
+
+# pylint: disable=useless-object-inheritance
+
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+
+
+class AsyncEngine(object):
+    """
+    Owns an event loop thread and the AsyncElasticsearch client that runs on it
+    """
+
+    def __init__(self, hosts, arguments):
+        # (List[Dict[str, Any]], Dict[str, Any]) -> None
+        try:
+            # pylint: disable=import-outside-toplevel
+            from elasticsearch import AsyncElasticsearch
+        except ImportError as error:
+            raise ValueError(
+                "transport async requires the elasticsearch async dependencies: {error}".format(
+                    error=error
+                )
+            ) from error
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = self._run(_create(AsyncElasticsearch, hosts, arguments)).result()
+
+    def submit(self, path, arguments):
+        """
+        Start the client method identified by the path, returning a future for the response
+        """
+        # (Tuple[str, ...], Dict[str, Any]) -> Future
+        method = self.client
+        for name in path:
+            method = getattr(method, name)
+        return self._run(method(**arguments))
+
+    def close(self):
+        """
+        Close the client and stop the event loop
+        """
+        # () -> None
+        if not self.loop.is_running():
+            return
+        try:
+            self._run(self.client.close()).result(timeout=10)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def _run(self, coroutine):
+        # (Coroutine) -> Future
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+class EngineClient(object):
+    """
+    A synchronous facade over the engine that looks like the Elasticsearch client.
+    Calling a method waits for the response, while submit returns a future.
+    """
+
+    def __init__(self, engine, path=()):
+        # (AsyncEngine, Tuple[str, ...]) -> None
+        self.engine = engine
+        self.path = path
+
+    def __getattr__(self, name):
+        # (str) -> EngineClient
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return EngineClient(self.engine, self.path + (name,))
+
+    def __call__(self, **arguments):
+        # (**Any) -> Any
+        return self.submit(**arguments).result()
+
+    def submit(self, **arguments):
+        """
+        Start the request, returning a future for the response
+        """
+        # (**Any) -> Future
+        return self.engine.submit(self.path, arguments)
+
+    def close(self):
+        """
+        Close the client and stop its event loop
+        """
+        # () -> None
+        self.engine.close()
+
+
+def make_async_client(hosts, arguments):
+    """
+    Create a client that runs requests on an event loop thread.
+    The event loop is stopped when the client is garbage collected.
+    """
+    # (List[Dict[str, Any]], Dict[str, Any]) -> EngineClient
+    engine = AsyncEngine(hosts, arguments)
+    client = EngineClient(engine)
+    weakref.finalize(client, engine.close)
+    return client
+
+
+def submit(method, **arguments):
+    """
+    Start a request with either kind of client, returning a future for the response.
+    The request completes before this returns when the client is synchronous.
+    """
+    # (Callable[..., Any], **Any) -> Future
+    # Clients that start requests themselves, such as the async client, provide submit
+    if hasattr(method, "submit"):
+        return method.submit(**arguments)
+
+    future = Future()
+    try:
+        future.set_result(method(**arguments))
+    except Exception as exception:  # pylint: disable=broad-except
+        future.set_exception(exception)
+    return future
+
+
+def send(method, **arguments):
+    """
+    Make a request when the response is not needed.
+    An async client does not wait for the response, so any failure is ignored.
+    """
+    # (Callable[..., Any], **Any) -> None
+    if hasattr(method, "submit"):
+        method.submit(**arguments)
+    else:
+        method(**arguments)
+
+
+async def _create(client_class, hosts, arguments):
+    # The async client must be created on the event loop that runs it
+    return client_class(hosts, **arguments)
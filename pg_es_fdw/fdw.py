@@ -2,13 +2,48 @@
 
 # pylint: disable=too-many-instance-attributes, import-error, unexpected-keyword-arg, broad-except, line-too-long
 
+import itertools
 import logging
+import time
+from collections import namedtuple
 
+from elasticsearch.exceptions import NotFoundError
 from multicorn import ForeignDataWrapper
 from multicorn.utils import log_to_postgres as log2pg
 
+from .aggregates import (
+    AGGREGATE_OPERATORS,
+    Aggregation,
+    aggregate_rows,
+    get_aggregate_functions,
+)
+from .bulk import BulkWriter, WriteLog
+from .cache import COUNT_CACHE, RESULT_CACHE, STATISTICS_CACHE, make_key
+from .clients import CLIENTS
 from .columns import make_columns
+from .engine import submit
+from .metrics import MeteredClient, Metrics, make_hooks
 from .options import ElasticsearchFDWOptions
+from .quals import get_lookup_ids, qual_matches, translate_quals
+from .scan import make_scan
+from .statistics import EMPTY_STATISTICS, load_statistics
+from .stats import STATS
+
+# The translation of a scan into an elasticsearch search
+SearchPlan = namedtuple(
+    "SearchPlan",
+    [
+        "query",
+        "sort",
+        "filters",
+        "rechecked",
+        "sort_clause",
+        "sortkeys",
+        "ids",
+        "limit",
+        "offset",
+    ],
+)
 
 
 class ElasticsearchFDW(ForeignDataWrapper):
@@ -25,23 +60,67 @@ class ElasticsearchFDW(ForeignDataWrapper):
 
         return self.options.rowid_column
 
+    @property
+    def client(self):
+        """The Elastic Search client, shared with other tables that use the same settings."""
+
+        return CLIENTS.get(self.client_key, self.options)
+
     def __init__(self, options, columns):
         super(ElasticsearchFDW, self).__init__(options, columns)
 
         self.options = ElasticsearchFDWOptions(options)
         self.columns = make_columns(options=self.options, columns=columns)
-        self.client = self.options.make_client()
-        self.scroll_id = None
+        self.client_key = self.options.get_client_key()
+        self.scan = None
+        # True while the current scan holds the shared client, which keeps it open
+        self.holding_client = False
+        # The qualifiers of the planned scan that postgres has to check, None until it is planned
+        self.planned_rechecks = None
+        # The rows of the current page of the scan by id, used for RETURNING
+        self.scanned = {}
+        self.metrics_hooks = make_hooks(
+            self.options.metrics_hooks, self.options.metrics_log_level
+        )
+        self.scan_metrics = None
+        self.modify_metrics = None
+        self.writer = BulkWriter(self._modify_client, self.options)
+        if self.options.coalesce_writes:
+            self.writes = WriteLog(
+                self.writer, max_size=self.options.coalesce_max_documents
+            )
+        else:
+            self.writes = self.writer
 
     def get_rel_size(self, quals, columns):
         """Helps the planner by returning costs.
         Returns a tuple of the form (number of rows, average row width)"""
 
+        self.planned_rechecks = None
         try:
             query = self.options.get_query(quals)
-            arguments = self.options.get_query_arguments(query)
-            response = self.client.count(**arguments)
-            return (response["count"], len(columns) * 100)
+            filters, rechecked = translate_quals(quals, self.columns)
+            self.planned_rechecks = rechecked
+            arguments = self.options.get_query_arguments(query, filters)
+            # An async client counts while the statistics are loaded
+            wait_for_count = self._start_count(arguments)
+            statistics = self._statistics()
+
+            # The index estimate ignores the filters so every qualifier reduces the rows
+            if self.options.count_estimate == "index":
+                estimated = [
+                    qual
+                    for qual in quals
+                    if qual.field_name
+                    not in {self.options.query_column, self.options.sort_column}
+                ]
+            else:
+                estimated = rechecked
+            count = wait_for_count()
+            rows = count * statistics.get_selectivity(estimated)
+            if count:
+                rows = max(rows, 1)
+            return (int(round(rows)), statistics.get_width(columns))
         except Exception as exception:
             log2pg(
                 "COUNT for {path} failed: {exception}".format(
@@ -51,59 +130,453 @@ class ElasticsearchFDW(ForeignDataWrapper):
             )
             return (0, 0)
 
-    def execute(self, quals, columns):
+    def get_path_keys(self):
+        """Returns the columns that are efficient to look up, and the number of rows
+        each lookup returns. This lets postgres use parameterized scans when joining
+        against the foreign table."""
+
+        path_keys = [((self.options.rowid_column,), 1)]
+        statistics = self._statistics()
+        keyword_columns = [
+            column for column in self.columns.columns if column.is_keyword
+        ]
+        if not keyword_columns or statistics is EMPTY_STATISTICS:
+            return path_keys
+
+        try:
+            count = self._count(self.options.get_query_arguments(None))
+        except Exception as exception:
+            log2pg(
+                "COUNT for {path} failed: {exception}".format(
+                    path=self.options.path, exception=exception
+                ),
+                logging.WARNING,
+            )
+            return path_keys
+
+        for column in keyword_columns:
+            cardinality = statistics.cardinalities.get(column.name)
+            if cardinality:
+                path_keys.append(((column.name,), max(1, count // cardinality)))
+        return path_keys
+
+    def can_sort(self, sortkeys):
+        """Returns the leading sort keys that Elastic Search can sort by.
+        Postgres sorts the rows itself if not all of the sort keys are returned."""
+
+        accepted = []
+        for sortkey in sortkeys:
+            if not self.columns.can_sort(sortkey):
+                break
+            accepted.append(sortkey)
+        return accepted
+
+    def can_limit(self, limit, offset):  # pylint: disable=unused-argument
+        """Returns True if the LIMIT and OFFSET can be applied by Elastic Search.
+        They are only applied when every qualifier is handled by Elastic Search."""
+
+        return self.planned_rechecks is not None and not self.planned_rechecks
+
+    def can_pushdown_upperrel(self):
+        """Returns the aggregates and grouping that can be pushed down to Elastic Search.
+        Aggregates that Elastic Search cannot calculate exactly are calculated here."""
+
+        if not self.options.aggregate_pushdown:
+            return None
+        return {
+            "groupby_supported": True,
+            "agg_functions": get_aggregate_functions(self.columns),
+            "operators_supported": list(AGGREGATE_OPERATORS),
+        }
+
+    def execute(  # pylint: disable=too-many-arguments
+        self,
+        quals,
+        columns,
+        sortkeys=None,
+        limit=None,
+        offset=None,
+        aggs=None,
+        group_clauses=None,
+    ):
         """Execute the query"""
 
+        # A rescan replaces the scan, which must release its search context first
+        self._close_scan()
+        if self.scan_metrics is None:
+            self.scan_metrics = Metrics("scan", self.options.path)
+
+        if aggs or group_clauses:
+            aggregation = Aggregation(self.columns, aggs or {}, group_clauses or [])
+            yield from self._execute_aggregation(quals, aggregation, limit, offset)
+            return
+
         try:
-            query = self.options.get_query(quals)
-            sort = self.options.get_sort(quals)
-            arguments = self.options.get_query_arguments(query)
-            arguments.update(self.options.get_pagination_arguments(sort))
+            plan = self._plan_search(quals, sortkeys, limit, offset)
+            overlay = self._use_write_overlay(plan, limit)
+            self.scan_metrics.record_pushdown(
+                pushed=len(quals) - len(plan.rechecked),
+                rechecked=len(plan.rechecked),
+                sorted_=bool(sortkeys),
+                limited=plan.limit is not None,
+            )
+            yield from self._execute_search(plan, columns, overlay)
+        except Exception as exception:
+            log2pg(
+                "SEARCH for {path} failed: {exception}".format(
+                    path=self.options.path, exception=exception
+                ),
+                logging.ERROR,
+            )
+            return
 
-            response = self.client.search(**arguments)
+    def explain(self, quals, columns, sortkeys=None, verbose=False):
+        """Describe the search that Elastic Search is sent for the scan.
+        With EXPLAIN ANALYZE the requests that the scan made are described too."""
 
-            while True:
-                self.scroll_id = response["_scroll_id"]
+        try:
+            plan = self._plan_search(quals, sortkeys, None, None)
+            arguments = self._get_search_arguments(plan, columns)
+            request = {
+                key: value
+                for key, value in arguments.items()
+                if key not in {"index", "doc_type", "_source", "filter_path"}
+            }
+            scan = make_scan(
+                None,
+                self.options,
+                arguments,
+                plan.sort_clause,
+                limit=plan.limit,
+                offset=plan.offset,
+            )
+            pushed = [qual for qual in quals if qual not in plan.rechecked]
+            count = COUNT_CACHE.get(
+                self._get_count_key(
+                    self.options.get_query_arguments(plan.query, plan.filters)
+                )
+            )
 
-                for row in response["hits"]["hits"]:
-                    yield self.columns.deserialize(
-                        row=row, query=query, sort=sort, columns=columns
+            lines = [
+                "Elasticsearch path: {path}".format(path=self.options.path),
+                "Elasticsearch request: {request}".format(
+                    request=self.options.serializer.dumps(request)
+                ),
+                "Elasticsearch sort: {sort}".format(
+                    sort=(
+                        self.options.serializer.dumps(plan.sort_clause)
+                        if isinstance(plan.sort_clause, list)
+                        else plan.sort_clause or "none"
+                    )
+                ),
+                "Elasticsearch pagination: {scan}".format(scan=scan.describe()),
+                "Elasticsearch source: {source}".format(
+                    source=_describe_source(arguments.get("_source"))
+                ),
+                "Elasticsearch filters: {quals}".format(quals=_describe_quals(pushed)),
+                "Rechecked filters: {quals}".format(
+                    quals=_describe_quals(plan.rechecked)
+                ),
+                "Estimated count: {count}".format(
+                    count="not cached" if count is None else count
+                ),
+            ]
+            if verbose:
+                lines.append(
+                    "Elasticsearch response fields: {filter_path}".format(
+                        filter_path=arguments.get("filter_path")
+                    )
+                )
+            if self.scan_metrics is not None:
+                metrics = self.scan_metrics.as_dict()
+                lines.append(
+                    "Elasticsearch requests: {requests} taking {took:.3f}s".format(
+                        requests=", ".join(
+                            "{api} {count}".format(api=api, count=count)
+                            for api, count in sorted(metrics["requests"].items())
+                        )
+                        or "none",
+                        took=metrics["took"] / 1000.0,
                     )
+                )
+            return lines
+        except Exception as exception:
+            log2pg(
+                "EXPLAIN for {path} failed: {exception}".format(
+                    path=self.options.path, exception=exception
+                ),
+                logging.WARNING,
+            )
+            return []
 
-                if len(response["hits"]["hits"]) < self.options.scroll_size:
-                    return
-                response = self.client.scroll(
-                    scroll_id=self.scroll_id, scroll=self.options.scroll_duration
+    def _plan_search(self, quals, sortkeys, limit, offset):
+        """Translate the scan into the query, filters, sort, limit and offset of the search."""
+
+        query = self.options.get_query(quals)
+        sort = self.options.get_sort(quals)
+        filters, rechecked = translate_quals(quals, self.columns)
+        if rechecked:
+            # postgres filters the rows afterwards, so any limit would drop matches
+            limit, offset = None, None
+        # Lookups by id return a known number of documents so they can be read in one page
+        ids = get_lookup_ids(quals, self.columns)
+        if ids is not None:
+            limit = len(ids) if limit is None else min(limit, len(ids))
+        if sortkeys:
+            sort_clause = self.columns.get_sort_clause(sortkeys)
+        else:
+            sort_clause = sort
+        return SearchPlan(
+            query=query,
+            sort=sort,
+            filters=filters,
+            rechecked=rechecked,
+            sort_clause=sort_clause,
+            sortkeys=sortkeys,
+            ids=ids,
+            limit=limit,
+            offset=offset,
+        )
+
+    def _get_search_arguments(self, plan, columns):
+        """Get the arguments of the search, which only returns the fields that are read."""
+
+        # A limited search without an order returns the most relevant documents
+        score = (
+            self.columns.is_score_requested(columns, plan.sortkeys)
+            or (isinstance(plan.sort_clause, str) and "_score" in plan.sort_clause)
+            or (
+                plan.query is not None
+                and plan.limit is not None
+                and not plan.sort_clause
+            )
+        )
+
+        arguments = self.options.get_query_arguments(
+            plan.query, plan.filters, score=score
+        )
+        arguments.update(
+            self.options.get_source_arguments(self.columns.get_source_fields(columns))
+        )
+        arguments.update(
+            self.options.get_response_arguments(
+                self.columns.get_hit_fields(columns, score)
+            )
+        )
+        return arguments
+
+    def _use_write_overlay(self, plan, limit):
+        """Make the waiting writes visible to the scan, returning True to overlay them.
+        Lookups by id alone can read them from the write log, otherwise they are sent.
+        Elastic Search checks other filters against the stored documents,
+        so it would drop the documents that a waiting update makes match."""
+
+        overlay = (
+            self.writes is not self.writer
+            and self.writer.is_empty
+            and plan.ids is not None
+            and plan.query is None
+            and all("ids" in clause for clause in plan.filters)
+            and limit is None
+        )
+        if not overlay and not self.writes.is_empty:
+            self.writes.finish()
+        return overlay
+
+    def _execute_search(self, plan, columns, overlay):
+        """Generate the rows of the search, reading them from the result cache if possible."""
+
+        arguments = self._get_search_arguments(plan, columns)
+
+        # Rows overlaid with the waiting writes are never cached
+        cache_key = None
+        if self.options.result_cache_ttl > 0 and not overlay:
+            cache_key = make_key(
+                "search",
+                self.client_key,
+                arguments,
+                plan.sort_clause,
+                plan.limit,
+                plan.offset,
+                None if columns is None else sorted(columns),
+                plan.query,
+                plan.sort,
+            )
+            cached = self._get_cached_rows(cache_key)
+            if cached is not None:
+                yield from cached
+                return
+
+        self.scan = make_scan(
+            self._scan_client(),
+            self.options,
+            arguments,
+            plan.sort_clause,
+            limit=plan.limit,
+            offset=plan.offset,
+        )
+        projector = self.columns.make_projector(columns, plan.query, plan.sort)
+        pages = self.scan.pages()
+        if overlay:
+            pages = self.writes.overlay(pages, plan.ids)
+        rows = self._project_rows(pages, projector)
+        if cache_key is not None:
+            rows = self._cache_rows(cache_key, rows)
+        yield from rows
+
+    def _execute_aggregation(self, quals, aggregation, limit, offset):
+        """Generate the aggregated rows.
+        Postgres does not check the qualifiers of an aggregated scan,
+        so rows that Elastic Search cannot check are checked and aggregated here."""
+
+        try:
+            if not self.writes.is_empty:
+                self.writes.finish()
+
+            query = self.options.get_query(quals)
+            filters, rechecked = translate_quals(quals, self.columns)
+            arguments = self.options.get_query_arguments(query, filters, score=False)
+
+            cache_key = None
+            if self.options.result_cache_ttl > 0:
+                cache_key = make_key(
+                    "aggregate",
+                    self.client_key,
+                    arguments,
+                    # The locally aggregated rows depend on the rechecked qualifiers
+                    [
+                        (qual.field_name, qual.operator, qual.value)
+                        for qual in rechecked
+                    ],
+                    aggregation.aggs,
+                    aggregation.group_clauses,
+                    limit,
+                    offset,
                 )
+                cached = self._get_cached_rows(cache_key)
+                if cached is not None:
+                    yield from cached
+                    return
+
+            rows = _limit_rows(
+                self._aggregate_rows(query, arguments, aggregation, rechecked),
+                limit,
+                offset,
+            )
+            if cache_key is not None:
+                rows = self._cache_rows(cache_key, rows)
+            for row in rows:
+                self.scan_metrics.record_rows(1)
+                yield row
         except Exception as exception:
             log2pg(
-                "SEARCH for {path} failed: {exception}".format(
+                "AGGREGATE for {path} failed: {exception}".format(
                     path=self.options.path, exception=exception
                 ),
                 logging.ERROR,
             )
             return
 
+    def _aggregate_rows(self, query, arguments, aggregation, rechecked):
+        """Generate the aggregated rows, using Elastic Search aggregations if possible.
+        Otherwise the scanned rows are checked and aggregated here."""
+
+        pushed = not rechecked and aggregation.is_pushable
+        self.scan_metrics.record_aggregation(pushed)
+        if pushed:
+            return aggregation.search(self._scan_client(), self.options, arguments)
+
+        names = aggregation.get_read_columns() | {qual.field_name for qual in rechecked}
+        arguments.update(
+            self.options.get_source_arguments(self.columns.get_source_fields(names))
+        )
+        arguments.update(
+            self.options.get_response_arguments(
+                self.columns.get_hit_fields(names, score=False)
+            )
+        )
+        self.scan = make_scan(self._scan_client(), self.options, arguments, None)
+        projector = self.columns.make_projector(names, query, None)
+        rows = (
+            projector.as_dict(projector.project(hit))
+            for hits in self.scan.pages()
+            for hit in hits
+        )
+        return aggregate_rows(
+            (row for row in rows if all(qual_matches(qual, row) for qual in rechecked)),
+            aggregation.aggs,
+            aggregation.group_clauses,
+        )
+
+    def _project_rows(self, pages, projector):
+        """Generate the rows of the pages of hits.
+        The rows of the current page are kept by id when RETURNING needs them."""
+
+        project = projector.project
+        for hits in pages:
+            started = time.perf_counter()
+            rows = [project(hit) for hit in hits]
+            self.scan_metrics.record_rows(len(rows), time.perf_counter() - started)
+            if self.options.complete_returning:
+                self.scanned = {
+                    hit["_id"]: projector.as_dict(row) for hit, row in zip(hits, rows)
+                }
+            yield from rows
+
+    def _get_cached_rows(self, key):
+        """Get the cached rows for the query, counting the hits and misses of the result cache."""
+
+        rows = RESULT_CACHE.get(self.options.path, key)
+        self.scan_metrics.record_cache(rows is not None)
+        if rows is not None:
+            self.scan_metrics.record_rows(len(rows))
+        log2pg(
+            "RESULT CACHE {outcome} for {path}: {hits} hits and {misses} misses".format(
+                outcome="hit" if rows is not None else "miss",
+                path=self.options.path,
+                hits=RESULT_CACHE.hits,
+                misses=RESULT_CACHE.misses,
+            ),
+            logging.DEBUG,
+        )
+        return rows
+
+    def _cache_rows(self, key, rows):
+        """Generate the rows, caching them once they have all been read.
+        Results with more than result_cache_max_rows rows are not cached."""
+
+        cached = []
+        for row in rows:
+            if cached is not None:
+                cached.append(row)
+                if len(cached) > self.options.result_cache_max_rows:
+                    cached = None
+            yield row
+        if cached is not None:
+            RESULT_CACHE.set(
+                self.options.path, key, cached, ttl=self.options.result_cache_ttl
+            )
+
     def end_scan(self):
         """Hook called at the end of a foreign scan."""
-        if self.scroll_id:
-            self.client.clear_scroll(scroll_id=self.scroll_id)
-            self.scroll_id = None
+        self._close_scan()
+        self.scanned = {}
+        metrics, self.scan_metrics = self.scan_metrics, None
+        self._finish_metrics(metrics)
 
     def insert(self, new_values):
-        """Insert new documents into Elastic Search"""
+        """Insert new documents into Elastic Search.
+        The inserted values are the whole document, so RETURNING uses them."""
+        RESULT_CACHE.invalidate(self.options.path)
+        self._record_write()
+        returning = dict(new_values)
         document_id, document = self.columns.serialize(new_values)
 
         try:
-            response = self.client.index(
-                id=document_id,
-                body=document,
-                refresh=self.options.refresh,
-                **self.options.arguments
-            )
+            self.writes.index(document_id, document)
             if self.options.complete_returning:
-                return self._read_by_id(response["_id"])
-            return {self.options.rowid_column: response["_id"]}
+                return returning
+            return {self.options.rowid_column: document_id}
         except Exception as exception:
             log2pg(
                 "INDEX for {path}/{document_id} and document {document} failed: {exception}".format(
@@ -117,19 +590,24 @@ class ElasticsearchFDW(ForeignDataWrapper):
             return (0, 0)
 
     def update(self, document_id, new_values):
-        """Update existing documents in Elastic Search"""
+        """Update existing documents in Elastic Search.
+        RETURNING uses the scanned row with the new values,
+        and only reads the document if columns are missing."""
+        RESULT_CACHE.invalidate(self.options.path)
+        self._record_write()
+        returning = dict(self.scanned.get(str(document_id), {}))
+        returning.update(new_values)
         _, document = self.columns.serialize(new_values)
 
         try:
-            response = self.client.update(
-                id=document_id,
-                body=document,
-                refresh=self.options.refresh,
-                **self.options.arguments
-            )
-            if self.complete_returning:
-                return self._read_by_id(response["_id"])
-            return {self.options.rowid_column: response["_id"]}
+            self.writes.update(document_id, document)
+            if self.options.complete_returning:
+                if self.columns.is_complete(returning):
+                    return returning
+                self.writes.flush()
+                self.writes.wait()
+                return self._read_by_id(document_id)
+            return {self.options.rowid_column: document_id}
         except Exception as exception:
             log2pg(
                 "UPDATE for {path}/{document_id} and document {document} failed: {exception}".format(
@@ -143,17 +621,22 @@ class ElasticsearchFDW(ForeignDataWrapper):
             return (0, 0)
 
     def delete(self, document_id):
-        """Delete documents from Elastic Search"""
-
-        if self.options.complete_returning:
-            document = self._read_by_id(document_id)
-        else:
-            document = {self.options.rowid_column: document_id}
+        """Delete documents from Elastic Search.
+        RETURNING uses the scanned row, and only reads the document if needed."""
 
+        RESULT_CACHE.invalidate(self.options.path)
+        self._record_write()
         try:
-            self.client.delete(
-                id=document_id, refresh=self.options.refresh, **self.options.arguments
-            )
+            if self.options.complete_returning:
+                document = self.scanned.get(str(document_id))
+                if document is None:
+                    self.writes.flush()
+                    self.writes.wait()
+                    document = self._read_by_id(document_id)
+            else:
+                document = {self.options.rowid_column: document_id}
+
+            self.writes.delete(document_id)
             return document
         except Exception as exception:
             log2pg(
@@ -164,16 +647,196 @@ class ElasticsearchFDW(ForeignDataWrapper):
             )
             return (0, 0)
 
+    def end_modify(self):
+        """Hook called at the end of a modification, sends the buffered writes.
+        Coalesced writes are held until the transaction commits."""
+        if self.writes is self.writer:
+            self._finish_writes()
+            self._finish_modify_metrics()
+
+    def pre_commit(self):
+        """Hook called before the transaction commits, sends any buffered writes."""
+        self._finish_writes()
+        self._finish_modify_metrics()
+
+    def rollback(self):
+        """Hook called when the transaction is rolled back, discards the buffered writes."""
+        self.writes.clear()
+        self._finish_modify_metrics()
+
+    def sub_begin(self, level):  # pylint: disable=unused-argument
+        """Hook called when a subtransaction starts."""
+        if self.writes is not self.writer:
+            self.writes.savepoint()
+
+    def sub_commit(self, level):  # pylint: disable=unused-argument
+        """Hook called when a subtransaction commits."""
+        if self.writes is not self.writer:
+            self.writes.release()
+
+    def sub_rollback(self, level):  # pylint: disable=unused-argument
+        """Hook called when a subtransaction is rolled back, discarding its coalesced writes."""
+        if self.writes is not self.writer:
+            self.writes.rollback_to()
+
+    def _finish_writes(self):
+        """Send the buffered writes, raising an error in postgres if any fail."""
+
+        try:
+            self.writes.finish()
+        except Exception as exception:
+            self.writes.clear()
+            log2pg(
+                "BULK for {path} failed: {exception}".format(
+                    path=self.options.path, exception=exception
+                ),
+                logging.ERROR,
+            )
+
+    def _close_scan(self):
+        """Close the current scan, releasing its search context and its client."""
+
+        if self.scan is not None:
+            self.scan.close()
+            self.scan = None
+        if self.holding_client:
+            CLIENTS.release(self.client_key)
+            self.holding_client = False
+
+    def _scan_client(self):
+        """The client for the current scan, which records the requests in the metrics of the scan.
+        The shared client is held until the scan is closed."""
+
+        if self.holding_client:
+            client = self.client
+        else:
+            client = CLIENTS.hold(self.client_key, self.options)
+            self.holding_client = True
+        if self.scan_metrics is None:
+            return client
+        return MeteredClient(client, self.scan_metrics)
+
+    def _modify_client(self):
+        """The client for the current modification, which records the requests in the metrics of the modification."""
+
+        if self.modify_metrics is None:
+            return self.client
+        return MeteredClient(self.client, self.modify_metrics)
+
+    def _record_write(self):
+        """Count a written row in the metrics of the modification, starting them if required."""
+
+        if self.modify_metrics is None:
+            self.modify_metrics = Metrics("modify", self.options.path)
+        self.modify_metrics.record_rows(1)
+
+    def _finish_modify_metrics(self):
+        """Pass the metrics of the modification to the hooks once the writes have been sent."""
+
+        metrics, self.modify_metrics = self.modify_metrics, None
+        self._finish_metrics(metrics)
+
+    def _finish_metrics(self, metrics):
+        """Add the metrics of a scan or modification that has ended to the cumulative stats and pass them to the hooks.
+        A failing hook is reported but does not fail the query."""
+
+        if metrics is None:
+            return
+        metrics.finish()
+        STATS.add(metrics)
+        for hook in self.metrics_hooks:
+            try:
+                hook.finish(metrics)
+            except Exception as exception:
+                log2pg(
+                    "METRICS for {path} failed: {exception}".format(
+                        path=self.options.path, exception=exception
+                    ),
+                    logging.WARNING,
+                )
+
+    def _count(self, arguments):
+        """Count the documents that match the query, caching the result."""
+
+        return self._start_count(arguments)()
+
+    def _start_count(self, arguments):
+        """Start counting the documents that match the query, returning a function that waits for the count.
+        The count is cached when it is received.
+        The index document count is used instead when exact counts are not required."""
+
+        key = self._get_count_key(arguments)
+        count = COUNT_CACHE.get(key)
+        if count is not None:
+            return lambda: count
+
+        if self.options.count_estimate == "index":
+            future = submit(
+                self.client.indices.stats,
+                index=self.options.arguments["index"],
+                metric="docs",
+            )
+        else:
+            future = submit(self.client.count, **arguments)
+
+        def wait_for_count():
+            response = future.result()
+            if self.options.count_estimate == "index":
+                result = response["_all"]["primaries"]["docs"]["count"]
+            else:
+                result = response["count"]
+            COUNT_CACHE.set(key, result, ttl=self.options.count_cache_ttl)
+            return result
+
+        return wait_for_count
+
+    def _get_count_key(self, arguments):
+        """The key of the cached count of the documents that match the query."""
+
+        if self.options.count_estimate == "index":
+            return make_key("index", self.client_key, self.options.path)
+        return make_key("count", self.client_key, arguments)
+
+    def _statistics(self):
+        """Get the statistics for the columns of the index, loading them if they are not cached."""
+
+        if self.options.statistics_ttl <= 0:
+            return EMPTY_STATISTICS
+
+        key = make_key(
+            "statistics",
+            self.client_key,
+            self.options.path,
+            sorted(column.name for column in self.columns.columns),
+        )
+        statistics = STATISTICS_CACHE.get(key)
+        if statistics is None:
+            try:
+                statistics = load_statistics(self.client, self.options, self.columns)
+            except Exception as exception:
+                log2pg(
+                    "STATISTICS for {path} failed: {exception}".format(
+                        path=self.options.path, exception=exception
+                    ),
+                    logging.WARNING,
+                )
+                statistics = EMPTY_STATISTICS
+            STATISTICS_CACHE.set(key, statistics, ttl=self.options.statistics_ttl)
+        return statistics
+
     def _read_by_id(self, row_id):
+        """Read the document with a realtime GET, which does not wait for a refresh."""
+
         try:
             arguments = self.options.get_id_arguments(row_id)
-            results = self.client.search(**arguments)["hits"]["hits"]
-            if results:
-                return self.columns.deserialize(
-                    row=results[0], query=None, sort=None, columns=None
-                )
+            result = self._modify_client().get(**arguments)
+            result.setdefault("_score", None)
+            return self.columns.deserialize(
+                row=result, query=None, sort=None, columns=None
+            )
+        except NotFoundError:
             log2pg(
-                "SEARCH for {path} row_id {row_id} returned nothing".format(
+                "GET for {path} row_id {row_id} returned nothing".format(
                     path=self.options.path, row_id=row_id
                 ),
                 logging.WARNING,
@@ -181,9 +844,40 @@ class ElasticsearchFDW(ForeignDataWrapper):
             return {self.options.rowid_column: row_id}
         except Exception as exception:
             log2pg(
-                "SEARCH for {path} row_id {row_id} failed: {exception}".format(
+                "GET for {path} row_id {row_id} failed: {exception}".format(
                     path=self.options.path, row_id=row_id, exception=exception
                 ),
                 logging.ERROR,
             )
             return {}
+
+
+def _describe_quals(quals):
+    """Describe the qualifiers for EXPLAIN."""
+
+    if not quals:
+        return "none"
+    return ", ".join(
+        "{field} {operator} {value!r}".format(
+            field=qual.field_name, operator=qual.operator, value=qual.value
+        )
+        for qual in quals
+    )
+
+
+def _describe_source(source):
+    """Describe the fields of the document source that are returned for EXPLAIN."""
+
+    if source is None:
+        return "all fields"
+    if source is False:
+        return "none"
+    return ", ".join(source)
+
+
+def _limit_rows(rows, limit, offset):
+    """Skip the rows before the offset and stop after the limit."""
+
+    offset = offset or 0
+    stop = None if limit is None else offset + limit
+    return itertools.islice(rows, offset, stop)
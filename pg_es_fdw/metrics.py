@@ -0,0 +1,393 @@
+"""
+Instrumentation of the requests made by each scan and modification.
+The metrics are passed to hooks when the scan or modification ends,
+and a summary can be logged to postgres.
+"""
+
+# pylint: disable=useless-object-inheritance, too-many-instance-attributes, too-few-public-methods
+
+import bisect
+import importlib
+import logging
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections import Counter
+
+from multicorn.utils import \
+    log_to_postgres as log2pg  # pylint: disable=import-error
+
+from .engine import submit
+
+# The metrics of the request that the current thread is making, used to measure the json
+ACTIVE = threading.local()
+
+# The apis that open and release a search context on the cluster
+OPENING_APIS = {"open_point_in_time"}
+CLEARING_APIS = {"clear_scroll", "close_point_in_time"}
+
+# The upper bounds of the request latency histogram buckets in milliseconds.
+# Slower requests are counted in the inf bucket.
+LATENCY_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    # multicorn reports this level as a postgres NOTICE
+    "notice": 25,
+    "warning": logging.WARNING,
+}
+
+
+class Metrics(object):
+    """
+    The counters for a single scan or modification.
+    Requests are recorded by the threads that make them, so every update holds the lock.
+    """
+
+    def __init__(self, kind, path):
+        # (str, str) -> None
+        self.kind = kind
+        self.path = path
+        self.started = time.monotonic()
+        self.elapsed = None
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.errors = 0
+        self.request_seconds = 0.0
+        self.latencies = Counter()
+        # The time that elasticsearch reports in milliseconds
+        self.took = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.decode_seconds = 0.0
+        self.rows = 0
+        self.deserialize_seconds = 0.0
+        self.contexts_opened = 0
+        self.contexts_cleared = 0
+        self.bulk_actions = 0
+        self.bulk_failures = 0
+        # How much of the query elasticsearch handled
+        self.quals_pushed = 0
+        self.quals_rechecked = 0
+        self.sorts_pushed = 0
+        self.limits_pushed = 0
+        self.aggregates_pushed = 0
+        self.aggregates_local = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def record_request(self, api, arguments, response, seconds):
+        """
+        Record a request and the response, which is None when the request failed
+        """
+        # (str, Dict[str, Any], Optional[Any], float) -> None
+        took = response.get("took") if hasattr(response, "get") else None
+        body = arguments.get("body")
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds * 1000.0)
+        with self.lock:
+            self.requests[api] += 1
+            self.request_seconds += seconds
+            self.latencies[
+                str(LATENCY_BUCKETS[bucket]) if bucket < len(LATENCY_BUCKETS) else "inf"
+            ] += 1
+            if response is None:
+                self.errors += 1
+            if isinstance(took, (int, float)):
+                self.took += took
+            # Text bodies, such as bulk requests, are sent without encoding
+            if isinstance(body, (str, bytes)):
+                self.bytes_sent += len(body)
+            if api in OPENING_APIS or api == "search" and "scroll" in arguments:
+                self.contexts_opened += 1
+            elif api in CLEARING_APIS:
+                self.contexts_cleared += 1
+            if api == "bulk" and response is not None:
+                items = response.get("items") or []
+                self.bulk_actions += len(items)
+                self.bulk_failures += sum(
+                    1 for item in items for result in item.values() if "error" in result
+                )
+
+    def record_encode(self, size):
+        """
+        Record a request body that was encoded as json
+        """
+        # (int) -> None
+        with self.lock:
+            self.bytes_sent += size
+
+    def record_decode(self, size, seconds):
+        """
+        Record a response that was decoded from json
+        """
+        # (int, float) -> None
+        with self.lock:
+            self.bytes_received += size
+            self.decode_seconds += seconds
+
+    def record_rows(self, count, seconds=0.0):
+        """
+        Record rows that were returned to postgres or written to elasticsearch
+        """
+        # (int, float) -> None
+        with self.lock:
+            self.rows += count
+            self.deserialize_seconds += seconds
+
+    def record_pushdown(self, pushed, rechecked, sorted_, limited):
+        """
+        Record how many qualifiers elasticsearch checked, and if it sorted and limited the hits
+        """
+        # (int, int, bool, bool) -> None
+        with self.lock:
+            self.quals_pushed += pushed
+            self.quals_rechecked += rechecked
+            self.sorts_pushed += int(sorted_)
+            self.limits_pushed += int(limited)
+
+    def record_aggregation(self, pushed):
+        """
+        Record if elasticsearch calculated the aggregates, or the rows were aggregated locally
+        """
+        # (bool) -> None
+        with self.lock:
+            if pushed:
+                self.aggregates_pushed += 1
+            else:
+                self.aggregates_local += 1
+
+    def record_cache(self, hit):
+        """
+        Record a lookup in the result cache
+        """
+        # (bool) -> None
+        with self.lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def finish(self):
+        """
+        Stop the clock for the scan or modification
+        """
+        # () -> None
+        self.elapsed = time.monotonic() - self.started
+
+    def as_dict(self):
+        """
+        Get the counters as a dictionary
+        """
+        # () -> Dict[str, Any]
+        with self.lock:
+            return {
+                "kind": self.kind,
+                "path": self.path,
+                "elapsed": self.elapsed,
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "request_seconds": self.request_seconds,
+                "latencies": dict(self.latencies),
+                "took": self.took,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "decode_seconds": self.decode_seconds,
+                "rows": self.rows,
+                "deserialize_seconds": self.deserialize_seconds,
+                "contexts_opened": self.contexts_opened,
+                "contexts_cleared": self.contexts_cleared,
+                "bulk_actions": self.bulk_actions,
+                "bulk_failures": self.bulk_failures,
+                "quals_pushed": self.quals_pushed,
+                "quals_rechecked": self.quals_rechecked,
+                "sorts_pushed": self.sorts_pushed,
+                "limits_pushed": self.limits_pushed,
+                "aggregates_pushed": self.aggregates_pushed,
+                "aggregates_local": self.aggregates_local,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+            }
+
+    def describe(self):
+        """
+        Summarize the counters in a single line
+        """
+        # () -> str
+        metrics = self.as_dict()
+        requests = ", ".join(
+            "{api} {count}".format(api=api, count=count)
+            for api, count in sorted(metrics["requests"].items())
+        )
+        return (
+            "{kind} of {path}: {rows} rows in {elapsed:.3f}s, "
+            "{request_count} requests ({requests}) with {errors} errors in {request_seconds:.3f}s "
+            "of which elasticsearch took {took_seconds:.3f}s, "
+            "{bytes_received} bytes received and {bytes_sent} bytes sent, "
+            "decode {decode_seconds:.3f}s, deserialize {deserialize_seconds:.3f}s, "
+            "{contexts_opened} search contexts opened and {contexts_cleared} cleared"
+        ).format(
+            kind=metrics["kind"].upper(),
+            request_count=sum(metrics["requests"].values()),
+            requests=requests or "none",
+            took_seconds=metrics["took"] / 1000.0,
+            elapsed=metrics["elapsed"] or 0.0,
+            **{
+                key: value
+                for key, value in metrics.items()
+                if key not in {"kind", "requests", "latencies", "took", "elapsed"}
+            }
+        )
+
+
+class MetricsHook(object):
+    """
+    Receives the metrics of each scan and modification when it ends.
+    Hooks are named in the metrics_hooks table option and are created without arguments.
+    They are called by postgres, so they may log to postgres.
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def finish(self, metrics):
+        """
+        Handle the metrics of a scan or modification that has ended
+        """
+        # (Metrics) -> None
+
+
+class LogHook(MetricsHook):
+    """
+    Logs a summary of the metrics to postgres
+    """
+
+    def __init__(self, level):
+        # (int) -> None
+        self.level = level
+
+    def finish(self, metrics):
+        log2pg(metrics.describe(), self.level)
+
+
+class MeteredClient(object):
+    """
+    Wraps the elasticsearch client, or one of its namespaces,
+    recording every request in the metrics.
+    Requests made by other threads are recorded too, as the metrics are locked.
+    """
+
+    def __init__(self, client, metrics, path=()):
+        # (Any, Metrics, Tuple[str, ...]) -> None
+        self.client = client
+        self.metrics = metrics
+        self.path = path
+
+    def __getattr__(self, name):
+        # (str) -> MeteredClient
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return MeteredClient(
+            getattr(self.client, name), self.metrics, self.path + (name,)
+        )
+
+    def __call__(self, **arguments):
+        # (**Any) -> Any
+        started = time.perf_counter()
+        previous = getattr(ACTIVE, "metrics", None)
+        ACTIVE.metrics = self.metrics
+        response = None
+        try:
+            response = self.client(**arguments)
+            return response
+        finally:
+            ACTIVE.metrics = previous
+            self.metrics.record_request(
+                self.api, arguments, response, time.perf_counter() - started
+            )
+
+    @property
+    def api(self):
+        """
+        The name of the api, for example search or indices.refresh
+        """
+        # () -> str
+        return ".".join(self.path)
+
+    def submit(self, **arguments):
+        """
+        Start the request, returning a future for the response.
+        The response of an async client is decoded on its event loop, so it is not measured.
+        """
+        # (**Any) -> Future
+        if not hasattr(self.client, "submit"):
+            return submit(self.__call__, **arguments)
+
+        started = time.perf_counter()
+
+        def record(future):
+            response = None if future.exception() else future.result()
+            self.metrics.record_request(
+                self.api, arguments, response, time.perf_counter() - started
+            )
+
+        future = self.client.submit(**arguments)
+        future.add_done_callback(record)
+        return future
+
+
+def record_encode(size):
+    """
+    Record an encoded request body in the metrics of the request the current thread is making
+    """
+    # (int) -> None
+    metrics = getattr(ACTIVE, "metrics", None)
+    if metrics is not None:
+        metrics.record_encode(size)
+
+
+def record_decode(size, seconds):
+    """
+    Record a decoded response in the metrics of the request the current thread is making.
+    The size is remembered for adaptive paging.
+    """
+    # (int, float) -> None
+    ACTIVE.received = size
+    metrics = getattr(ACTIVE, "metrics", None)
+    if metrics is not None:
+        metrics.record_decode(size, seconds)
+
+
+def take_received():
+    """
+    Get the size of the last response that the current thread decoded, forgetting it.
+    This is None when the response was not decoded by this thread,
+    as happens with the async transport.
+    """
+    # () -> Optional[int]
+    size = getattr(ACTIVE, "received", None)
+    ACTIVE.received = None
+    return size
+
+
+def make_hooks(names, log_level):
+    """
+    Create the hooks named by their module and class, for example "mypackage.hooks.StatsdHook".
+    A hook that logs a summary is added when there is a log level.
+    """
+    # (List[str], Optional[int]) -> List[MetricsHook]
+    hooks = []
+    for name in names:
+        module_name, _, class_name = name.rpartition(".")
+        try:
+            hook_class = getattr(importlib.import_module(module_name), class_name)
+        except (ImportError, AttributeError, ValueError) as error:
+            raise ValueError(
+                "metrics hook {name} cannot be loaded: {error}".format(
+                    name=name, error=error
+                )
+            ) from error
+        hooks.append(hook_class())
+    if log_level is not None:
+        hooks.append(LogHook(log_level))
+    return hooks
@@ -9,6 +9,11 @@ import json
 from elasticsearch import VERSION as ELASTICSEARCH_VERSION
 from elasticsearch import Elasticsearch
 
+from .cache import make_key
+from .engine import make_async_client
+from .metrics import LOG_LEVELS
+from .serializer import get_client_arguments, make_serializer
+
 
 class ElasticsearchFDWOptions(object):
     """
@@ -24,34 +29,116 @@ class ElasticsearchFDWOptions(object):
         self.score_column = options.pop("score_column", None)
         self.default_sort = options.pop("default_sort", None)
         self.sort_column = options.pop("sort_column", None)
+        self.keyword_columns = _get_keyword_columns(options)
         self.scroll_size = _int_option(options, key="scroll_size", default=1000)
         self.scroll_duration = options.pop("scroll_duration", "10m")
+        self.adaptive_paging = _boolean_option(
+            options, key="adaptive_paging", default=False
+        )
+        self.page_size_min = _int_option(options, key="page_size_min", default=100)
+        self.page_size_max = _int_option(options, key="page_size_max", default=10000)
+        self.page_target_bytes = _int_option(
+            options, key="page_target_bytes", default=4 * 1024 * 1024
+        )
+        self.page_target_ms = _int_option(options, key="page_target_ms", default=500)
+        self.pagination = _get_pagination(options)
+        self.keep_alive = options.pop("keep_alive", "1m")
+        self.scan_slices = _int_option(options, key="scan_slices", default=1)
+        self.scan_workers = _int_option(
+            options, key="scan_workers", default=self.scan_slices
+        )
+        self.prefetch_pages = _int_option(options, key="prefetch_pages", default=0)
+        self.prefetch_max_hits = _int_option(
+            options, key="prefetch_max_hits", default=10 * self.scroll_size
+        )
         self.rowid_column = options.pop("rowid_column", "id")
         self.refresh = _get_refresh(options)
+        self.bulk_size = _int_option(options, key="bulk_size", default=500)
+        self.bulk_max_bytes = _int_option(
+            options, key="bulk_max_bytes", default=5 * 1024 * 1024
+        )
+        self.coalesce_writes = _boolean_option(
+            options, key="coalesce_writes", default=False
+        )
+        self.coalesce_max_documents = _int_option(
+            options, key="coalesce_max_documents", default=10000
+        )
+        self.count_estimate = _get_count_estimate(options)
+        self.count_cache_ttl = _int_option(options, key="count_cache_ttl", default=60)
+        self.statistics_ttl = _int_option(options, key="statistics_ttl", default=600)
+        self.statistics_sample_size = _int_option(
+            options, key="statistics_sample_size", default=100
+        )
+        self.result_cache_ttl = _int_option(options, key="result_cache_ttl", default=0)
+        self.result_cache_max_rows = _int_option(
+            options, key="result_cache_max_rows", default=10000
+        )
+        self.aggregate_pushdown = _boolean_option(
+            options, key="aggregate_pushdown", default=True
+        )
         self.complete_returning = _boolean_option(
             options, key="complete_returning", default=False
         )
+        self.metrics_log_level = _get_metrics_log_level(options)
+        self.metrics_hooks = _get_metrics_hooks(options)
 
         self.host = options.pop("host", "localhost")
         self.scheme = options.pop("scheme", None)
         self.port = _int_option(options, key="port", default=9200)
         self.timeout = _int_option(options, key="timeout", default=10)
         self.auth = _get_authentication(options)
+        self.pool_size = _int_option(options, key="pool_size", default=None)
+        self.transport = _get_transport(options)
+        self.serializer = make_serializer(_get_serializer(options))
+        self.client_idle_timeout = _int_option(
+            options, key="client_idle_timeout", default=300
+        )
+        self.http_keep_alive = _boolean_option(
+            options, key="http_keep_alive", default=True
+        )
         self.options = options
 
     def make_client(self):
         """
-        Creates an elasticsearch client from the options
+        Creates an elasticsearch client from the options.
+        The async transport creates a client that runs requests on an event loop thread.
         """
-        # () -> Elasticsearch
+        # () -> Union[Elasticsearch, EngineClient]
         settings = {"host": self.host, "port": self.port}
         if self.scheme:
             settings["scheme"] = self.scheme
-        return Elasticsearch(
-            [settings],
-            basic_auth=self.auth,
-            timeout=self.timeout,
-            **self.options,
+        arguments = dict(self.options)
+        arguments["basic_auth"] = self.auth
+        arguments["timeout"] = self.timeout
+        if self.pool_size is not None:
+            if ELASTICSEARCH_VERSION[0] >= 8:
+                arguments["connections_per_node"] = self.pool_size
+            else:
+                arguments["maxsize"] = self.pool_size
+        if not self.http_keep_alive:
+            # Every request opens a new connection, which the server closes after responding
+            arguments["headers"] = {"Connection": "close"}
+        arguments.update(get_client_arguments(self.serializer))
+        if self.transport == "async":
+            return make_async_client([settings], arguments)
+        return Elasticsearch([settings], **arguments)
+
+    def get_client_key(self):
+        """
+        Get the key that identifies the clients that can be shared between tables
+        """
+        # () -> str
+        return make_key(
+            self.host,
+            self.port,
+            self.scheme,
+            self.auth,
+            self.timeout,
+            self.pool_size,
+            self.http_keep_alive,
+            self.transport,
+            self.serializer.name,
+            self.options,
         )
 
     def get_query(self, quals):
@@ -62,26 +149,74 @@ class ElasticsearchFDWOptions(object):
         # quals - A list of Qual instances describing the filters applied to this scan.
         return _get_qual_value(quals, name=self.query_column, default=None)
 
-    def get_query_arguments(self, query):
+    def get_query_arguments(self, query, filters=None, score=True):
         """
-        Get the elasticsearch client options that identify the query, path and doc type
+        Get the elasticsearch client options that identify the query, path and doc type.
+        The filters are combined with the query in a bool query.
+        When the score is not needed the query runs in filter context,
+        which elasticsearch can cache.
         """
-        # (str) -> Dict[str, Any]
+        # (str, Optional[List[Dict[str, Any]]], bool) -> Dict[str, Any]
         arguments = self.arguments.copy()
-        if query:
-            if self.is_json_query:
-                arguments["body"] = json.loads(query)
-            else:
-                arguments["q"] = query
+        if not filters and score:
+            if query:
+                if self.is_json_query:
+                    arguments["body"] = json.loads(query)
+                else:
+                    arguments["q"] = query
+            return arguments
+
+        if query and self.is_json_query:
+            body = json.loads(query)
+        elif query:
+            body = {"query": {"query_string": {"query": query}}}
+        else:
+            body = {}
+
+        if filters:
+            bool_query = {"filter": filters}
+            if "query" in body:
+                bool_query["must"] = [body["query"]]
+            body["query"] = {"bool": bool_query}
+        if not score:
+            if "query" in body:
+                body["query"] = {"constant_score": {"filter": body["query"]}}
+            body.setdefault("track_scores", False)
+            if ELASTICSEARCH_VERSION[0] >= 6:
+                body.setdefault("track_total_hits", False)
+        arguments["body"] = body
         return arguments
 
+    def get_source_arguments(self, fields):
+        """
+        Get the elasticsearch client options that restrict the fields returned for each document.
+        When no fields are required the document source is not returned at all.
+        """
+        # (Optional[List[str]]) -> Dict[str, Any]
+        if fields is None:
+            return {}
+        if not fields:
+            return {"_source": False}
+        return {"_source": fields}
+
+    def get_response_arguments(self, fields):
+        """
+        Get the elasticsearch client options that trim the response to the time taken,
+        the scroll or point in time id and the fields of each hit that are read.
+        """
+        # (List[str]) -> Dict[str, Any]
+        filter_path = ["took", "_scroll_id", "pit_id"] + [
+            "hits.hits.{field}".format(field=field) for field in fields
+        ]
+        return {"filter_path": ",".join(filter_path)}
+
     def get_id_arguments(self, row_id):
         """
-        Get the elasticsearch client options that identify the query, path and doc type
+        Get the elasticsearch client options that identify the document, path and doc type
         """
         # (str) -> Dict[str, Any]
         arguments = self.arguments.copy()
-        arguments["body"] = {"query": {"ids": {"values": [row_id]}}}
+        arguments["id"] = row_id
         return arguments
 
     def get_sort(self, quals):
@@ -92,22 +227,42 @@ class ElasticsearchFDWOptions(object):
         # quals - A list of Qual instances describing the filters applied to this scan.
         return _get_qual_value(quals, name=self.sort_column, default=self.default_sort)
 
-    def get_pagination_arguments(self, sort):
+    def get_pagination_arguments(self, sort, size):
         """
         Get the elasticsearch client options that identify the sort, page size and scroll duration
         """
-        # (str) -> Dict[str, Any]
-        # Unknown key for a VALUE_NULL in [sort].
-        if sort is None:
-            return {
-                "size": self.scroll_size,
-                "scroll": self.scroll_duration,
-            }
-        return {
-            "sort": sort,
-            "size": self.scroll_size,
+        # (Union[None, str, List[Dict[str, Any]]], int) -> Dict[str, Any]
+        arguments = {
+            "size": size,
             "scroll": self.scroll_duration,
         }
+        return _with_sort(arguments, sort)
+
+    def get_page_arguments(self, sort, size, offset):
+        """
+        Get the elasticsearch client options for the sort, size and offset of a single page
+        """
+        # (Union[None, str, List[Dict[str, Any]]], int, int) -> Dict[str, Any]
+        arguments = {"size": size}
+        if offset:
+            arguments["from_"] = offset
+        return _with_sort(arguments, sort)
+
+
+def _with_sort(arguments, sort):
+    """
+    Adds the sort to the client options.
+    A sort string is passed as a parameter while a sort clause is passed in the body.
+    """
+    # (Dict[str, Any], Union[None, str, List[Dict[str, Any]]]) -> Dict[str, Any]
+    # Unknown key for a VALUE_NULL in [sort].
+    if sort is None:
+        return arguments
+    if isinstance(sort, list):
+        arguments["body"] = {"sort": sort}
+    else:
+        arguments["sort"] = sort
+    return arguments
 
 
 def _get_path_and_arguments(options):
@@ -127,6 +282,22 @@ def _get_path_and_arguments(options):
     return path, arguments
 
 
+def _get_keyword_columns(options):
+    """
+    Extracts the text columns that can be filtered on.
+    This is a comma separated list of columns, each of which can be followed by
+    the elasticsearch keyword field to filter on, for example "status,tag:tag.keyword".
+    """
+    # (Dict[str, str]) -> Dict[str, str]
+    keyword_columns = {}
+    for entry in options.pop("keyword_columns", "").split(","):
+        if not entry.strip():
+            continue
+        column, _, field = entry.partition(":")
+        keyword_columns[column.strip()] = field.strip() or column.strip()
+    return keyword_columns
+
+
 def _get_authentication(options):
     """
     Extracts the username and password for the elasticsearch client
@@ -155,6 +326,87 @@ def _get_refresh(options):
     return refresh
 
 
+def _get_pagination(options):
+    """
+    Extracts the pagination engine used to scan the index.
+    The auto engine is resolved by the scan, as it depends on the version of the cluster.
+    """
+    # (Dict[str, str]) -> str
+    pagination = options.pop("pagination", "auto").lower()
+    if pagination not in {"auto", "scroll", "pit"}:
+        raise ValueError("pagination option must be one of auto, scroll, or pit")
+    return pagination
+
+
+def _get_transport(options):
+    """
+    Extracts the transport used to make requests.
+    The async transport runs requests on an event loop so that independent requests overlap.
+    """
+    # (Dict[str, str]) -> str
+    transport = options.pop("transport", "sync").lower()
+    if transport not in {"sync", "async"}:
+        raise ValueError("transport option must be one of sync or async")
+    return transport
+
+
+def _get_serializer(options):
+    """
+    Extracts the json library used to encode requests and decode responses.
+    The auto serializer uses the fastest library that is installed.
+    """
+    # (Dict[str, str]) -> str
+    serializer = options.pop("serializer", "auto").lower()
+    if serializer not in {"auto", "json", "orjson", "simdjson"}:
+        raise ValueError(
+            "serializer option must be one of auto, json, orjson, or simdjson"
+        )
+    return serializer
+
+
+def _get_metrics_log_level(options):
+    """
+    Extracts the level that the metrics of each scan and modification are logged at.
+    The metrics are not logged by default.
+    """
+    # (Dict[str, str]) -> Optional[int]
+    level = options.pop("metrics_log_level", "none").lower()
+    if level == "none":
+        return None
+    if level not in LOG_LEVELS:
+        raise ValueError(
+            "metrics_log_level option must be one of none, debug, info, notice, or warning"
+        )
+    return LOG_LEVELS[level]
+
+
+def _get_metrics_hooks(options):
+    """
+    Extracts the hooks that receive the metrics of each scan and modification.
+    This is a comma separated list of classes named by their module,
+    for example "mypackage.hooks.StatsdHook".
+    """
+    # (Dict[str, str]) -> List[str]
+    return [
+        entry.strip()
+        for entry in options.pop("metrics_hooks", "").split(",")
+        if entry.strip()
+    ]
+
+
+def _get_count_estimate(options):
+    """
+    Extracts how the planner estimates the number of rows.
+    An exact estimate counts the matching documents,
+    while an index estimate uses the number of documents in the index.
+    """
+    # (Dict[str, str]) -> str
+    count_estimate = options.pop("count_estimate", "exact").lower()
+    if count_estimate not in {"exact", "index"}:
+        raise ValueError("count_estimate option must be one of exact or index")
+    return count_estimate
+
+
 def _boolean_option(options, key, default):
     # (Dict[str, str], str, bool) -> bool
     if key not in options:
@@ -0,0 +1,222 @@
+"""
+Translation of the postgres qualifiers into elasticsearch filters.
+Qualifiers that cannot be translated are left for postgres to recheck.
+"""
+
+# pylint: disable=too-many-return-statements
+
+import datetime
+import decimal
+import operator as operators
+import re
+
+RANGE_OPERATORS = {"<": "lt", "<=": "lte", ">": "gt", ">=": "gte"}
+LIKE_PATTERN = re.compile(r"\\(.)|([%_*?])")
+COMPARISONS = {
+    "=": operators.eq,
+    "<>": operators.ne,
+    "<": operators.lt,
+    "<=": operators.le,
+    ">": operators.gt,
+    ">=": operators.ge,
+}
+
+
+def translate_quals(quals, columns):
+    """
+    Split the qualifiers into elasticsearch filters and the qualifiers that postgres must check.
+    The postgres qualifiers that can be translated are rechecked by postgres anyway,
+    so the translation must only ever produce a superset of the matching rows.
+    """
+    # (List[multicorn.Qual], Columns) -> Tuple[List[Dict[str, Any]], List[multicorn.Qual]]
+    filters = []
+    rechecked = []
+    for qual in quals:
+        if qual.field_name in {columns.query_column, columns.sort_column}:
+            continue
+
+        clause = translate_qual(qual, columns)
+        if clause is None:
+            rechecked.append(qual)
+        else:
+            filters.append(clause)
+    return filters, rechecked
+
+
+def get_lookup_ids(quals, columns):
+    """
+    Get the ids of the documents that the qualifiers select.
+    Returns None unless the qualifiers select documents by id.
+    """
+    # (List[multicorn.Qual], Columns) -> Optional[Set[str]]
+    ids = None
+    for qual in quals:
+        if qual.field_name != columns.id_column.name:
+            continue
+        clause = _translate_id_qual(qual)
+        if clause is None:
+            continue
+        values = set(clause["ids"]["values"])
+        ids = values if ids is None else ids & values
+    return ids
+
+
+def translate_qual(qual, columns):
+    """
+    Translate a single qualifier into an elasticsearch filter clause.
+    Returns None if the qualifier cannot be translated.
+    """
+    # (multicorn.Qual, Columns) -> Optional[Dict[str, Any]]
+    if qual.field_name == columns.id_column.name:
+        return _translate_id_qual(qual)
+
+    column = columns.columns_by_name.get(qual.field_name)
+    if column is None or column.filter_field is None:
+        return None
+    field = column.filter_field
+
+    if qual.is_list_operator:
+        return _translate_list_qual(qual, field)
+
+    operator = qual.operator
+    value = qual.value
+    if value is None:
+        # multicorn represents IS NULL as = NULL and IS NOT NULL as <> NULL
+        if operator in {"=", "IS"}:
+            return _must_not({"exists": {"field": field}})
+        if operator in {"<>", "IS NOT"}:
+            return {"exists": {"field": field}}
+        return None
+
+    if operator == "=":
+        return {"term": {field: _to_json(value)}}
+    if operator == "<>":
+        return _not_equal({"term": {field: _to_json(value)}}, field)
+    if operator in RANGE_OPERATORS:
+        if column.is_keyword:
+            # keywords are compared bytewise, postgres compares text by the collation
+            return None
+        return {"range": {field: {RANGE_OPERATORS[operator]: _to_json(value)}}}
+    if operator == "~~":
+        return {"wildcard": {field: {"value": like_to_wildcard(value)}}}
+    return None
+
+
+def like_to_wildcard(pattern):
+    """
+    Convert a postgres LIKE pattern into an elasticsearch wildcard pattern
+    """
+    # (str) -> str
+
+    def _replace(match):
+        escaped, special = match.groups()
+        if escaped is not None:
+            return "\\" + escaped if escaped in "*?\\" else escaped
+        return {"%": "*", "_": "?", "*": "\\*", "?": "\\?"}[special]
+
+    return LIKE_PATTERN.sub(_replace, pattern)
+
+
+def qual_matches(qual, data):
+    """
+    Test if the row matches the qualifier.
+    This is used when postgres cannot check the qualifiers itself, as happens
+    when the rows are aggregated before they are returned.
+    """
+    # (multicorn.Qual, Dict[str, Any]) -> bool
+    value = data.get(qual.field_name)
+    if qual.is_list_operator:
+        operator, is_any = qual.operator
+        results = [_compare(operator, value, other) for other in qual.value]
+        return any(results) if is_any else all(results)
+    if qual.value is None:
+        if qual.operator in {"=", "IS"}:
+            return value is None
+        return value is not None
+    return _compare(qual.operator, value, qual.value)
+
+
+def _compare(operator, value, other):
+    # (str, Any, Any) -> bool
+    # Comparisons with NULL are never true in postgres
+    if value is None or other is None:
+        return False
+    if operator in {"~~", "!~~", "~~*", "!~~*"}:
+        flags = re.DOTALL | (re.IGNORECASE if "*" in operator else 0)
+        matched = _like_to_regex(other, flags).match(str(value)) is not None
+        return matched != operator.startswith("!")
+    if operator not in COMPARISONS:
+        raise ValueError("Unsupported operator {operator}".format(operator=operator))
+    return COMPARISONS[operator](_coerce(value, other), other)
+
+
+def _coerce(value, other):
+    """
+    Convert the document value to the type of the qualifier value.
+    Document ids are always strings, and dates are returned as strings by elasticsearch.
+    """
+    # (Any, Any) -> Any
+    if isinstance(other, bool) or not isinstance(value, str):
+        return value
+    if isinstance(other, (int, float, decimal.Decimal)):
+        return type(other)(value)
+    if isinstance(other, (datetime.date, datetime.datetime, datetime.time)):
+        return type(other).fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
+
+def _like_to_regex(pattern, flags):
+    # (str, int) -> Pattern
+
+    def _replace(match):
+        escaped, special = match.groups()
+        if escaped is not None:
+            return re.escape(escaped)
+        return {"%": ".*", "_": "."}.get(special, re.escape(special))
+
+    return re.compile(LIKE_PATTERN.sub(_replace, pattern) + r"\Z", flags)
+
+
+def _translate_id_qual(qual):
+    # (multicorn.Qual) -> Optional[Dict[str, Any]]
+    if qual.is_list_operator:
+        if qual.operator[0] != "=" or not qual.list_any_or_all:
+            return None
+        values = [str(value) for value in qual.value if value is not None]
+        return {"ids": {"values": values}}
+    if qual.operator != "=" or qual.value is None:
+        return None
+    return {"ids": {"values": [str(qual.value)]}}
+
+
+def _translate_list_qual(qual, field):
+    # (multicorn.Qual, str) -> Optional[Dict[str, Any]]
+    operator, is_any = qual.operator
+    values = [_to_json(value) for value in qual.value if value is not None]
+    if operator == "=" and is_any:
+        return {"terms": {field: values}}
+    if operator == "<>" and not is_any:
+        return _not_equal({"terms": {field: values}}, field)
+    return None
+
+
+def _must_not(clause):
+    # (Dict[str, Any]) -> Dict[str, Any]
+    return {"bool": {"must_not": [clause]}}
+
+
+def _not_equal(clause, field):
+    # (Dict[str, Any], str) -> Dict[str, Any]
+    # postgres does not match NULL with <> so the field must exist
+    return {"bool": {"filter": [{"exists": {"field": field}}], "must_not": [clause]}}
+
+
+def _to_json(value):
+    # (Any) -> Any
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
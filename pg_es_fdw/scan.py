@@ -0,0 +1,702 @@
+"""
+Engines that page through the results of a search.
+"""
+
+# pylint: disable=useless-object-inheritance, too-many-arguments, broad-except, too-many-instance-attributes
+
+import queue
+import threading
+import time
+from collections import deque
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import VERSION as ELASTICSEARCH_VERSION
+
+from .cache import PAGE_SIZE_CACHE, STATISTICS_CACHE, make_key
+from .engine import send
+from .metrics import take_received
+
+# The elasticsearch default for index.max_result_window
+DEFAULT_MAX_RESULT_WINDOW = 10000
+# How long the cluster version, the result window of an index
+# and the learned page sizes are remembered in seconds
+PAGING_TTL = 600
+# The _shard_doc tiebreaker of a point in time was introduced in 7.12
+POINT_IN_TIME_VERSION = (7, 12)
+
+
+class Scan(object):
+    """
+    Pages through the hits of a single search
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, client, options, arguments, sort):
+        # (Elasticsearch, ElasticsearchFDWOptions, Dict[str, Any], Optional[str]) -> None
+        self.client = client
+        self.options = options
+        self.arguments = arguments
+        self.sort = sort
+
+    @abstractmethod
+    def pages(self):
+        """
+        Generate the hits of the search one page at a time
+        """
+        # () -> Iterator[List[Dict[str, Any]]]
+
+    @abstractmethod
+    def close(self):
+        """
+        Release any resources held on the elasticsearch cluster
+        """
+        # () -> None
+
+    @abstractmethod
+    def describe(self):
+        """
+        Describe how the search is paged, for EXPLAIN
+        """
+        # () -> str
+
+
+class SingleScan(Scan):
+    """
+    Reads a single page of the search without holding a search context open.
+    This is used when the whole result fits in one page.
+    """
+
+    def __init__(self, client, options, arguments, sort, size, offset):
+        # (Elasticsearch, ElasticsearchFDWOptions, Dict[str, Any], Optional[str], int, int) -> None
+        super(SingleScan, self).__init__(client, options, arguments, sort)
+        self.size = size
+        self.offset = offset
+
+    def pages(self):
+        arguments = merge_arguments(
+            self.arguments,
+            self.options.get_page_arguments(self.sort, self.size, self.offset),
+        )
+        response = self.client.search(**arguments)
+        yield get_hits(response)
+
+    def close(self):
+        pass
+
+    def describe(self):
+        return "single page of {size} hits from {offset}".format(
+            size=self.size, offset=self.offset
+        )
+
+
+class ScrollScan(Scan):
+    """
+    Pages through the search using the scroll api
+    """
+
+    def __init__(self, client, options, arguments, sort, sizer=None):
+        # (Elasticsearch, ElasticsearchFDWOptions, Dict[str, Any], Optional[str],
+        #  Optional[PageSizer]) -> None
+        super(ScrollScan, self).__init__(client, options, arguments, sort)
+        self.scroll_id = None
+        # The size of a scroll is fixed by the first search, so it only adapts for the next scans
+        self.sizer = sizer or PageSizer(
+            options, options.scroll_size, options.scroll_size
+        )
+
+    def pages(self):
+        size = self.sizer.size
+        arguments = merge_arguments(
+            self.arguments, self.options.get_pagination_arguments(self.sort, size)
+        )
+        if "track_total_hits" in arguments.get("body", {}):
+            # elasticsearch rejects scroll searches that do not track the total hits
+            arguments["body"] = dict(arguments["body"])
+            del arguments["body"]["track_total_hits"]
+        extra = {}
+        if "filter_path" in arguments:
+            extra["filter_path"] = arguments["filter_path"]
+        response, seconds, received = request(self.client.search, **arguments)
+
+        while True:
+            self.scroll_id = response["_scroll_id"]
+            hits = get_hits(response)
+            if len(hits) < size:
+                yield hits
+                return
+            self.sizer.observe(len(hits), received, seconds)
+            yield hits
+
+            response, seconds, received = request(
+                self.client.scroll,
+                scroll_id=self.scroll_id,
+                scroll=self.options.scroll_duration,
+                **extra
+            )
+
+    def describe(self):
+        return "scroll with {pages} kept for {duration}".format(
+            pages=self.sizer.describe(), duration=self.options.scroll_duration
+        )
+
+    def close(self):
+        if self.scroll_id:
+            # The response is not needed, so an async client does not wait for it
+            send(self.client.clear_scroll, scroll_id=self.scroll_id)
+            self.scroll_id = None
+        self.sizer.save()
+
+
+class PointInTimeScan(Scan):
+    """
+    Pages through the search using a point in time and search_after.
+    This does not hold a search context open between pages for longer than the keep alive.
+    """
+
+    def __init__(self, client, options, arguments, sort, pit_id=None, sizer=None):
+        # (Elasticsearch, ElasticsearchFDWOptions, Dict[str, Any], Optional[str],
+        #  Optional[str], Optional[PageSizer]) -> None
+        super(PointInTimeScan, self).__init__(client, options, arguments, sort)
+        # A point in time that is provided is shared with other scans and is not closed by this one
+        self.pit_id = pit_id
+        self.owns_pit = pit_id is None
+        self.sizer = sizer or PageSizer(
+            options, options.scroll_size, options.scroll_size
+        )
+
+    def pages(self):
+        arguments = self.arguments.copy()
+        index = arguments.pop("index")
+        arguments.pop("doc_type", None)
+        # The body is shared with the plan of the scan, so the pages change a copy
+        body = dict(arguments.pop("body", {}))
+        query = arguments.pop("q", None)
+        if query:
+            body["query"] = {"query_string": {"query": query}}
+
+        if self.owns_pit:
+            self.pit_id = open_point_in_time(self.client, self.options, index)
+        # Queries in filter context give every document the same score
+        has_query = "query" in body and "constant_score" not in body["query"]
+        body["sort"] = get_sort_clause(self.sort, has_query=has_query)
+
+        while True:
+            size = self.sizer.size
+            body["size"] = size
+            body["pit"] = {"id": self.pit_id, "keep_alive": self.options.keep_alive}
+            response, seconds, received = request(
+                self.client.search, body=body, **arguments
+            )
+            self.pit_id = response.get("pit_id", self.pit_id)
+            hits = get_hits(response)
+            if len(hits) < size:
+                yield hits
+                return
+            self.sizer.observe(len(hits), received, seconds)
+            yield hits
+
+            body["search_after"] = hits[-1]["sort"]
+
+    def describe(self):
+        return "point in time with {pages} kept alive for {keep_alive}".format(
+            pages=self.sizer.describe(), keep_alive=self.options.keep_alive
+        )
+
+    def close(self):
+        if self.owns_pit and self.pit_id:
+            close_point_in_time(self.client, self.pit_id)
+        self.pit_id = None
+        self.sizer.save()
+
+
+class SlicedScan(Scan):
+    """
+    Splits the search into slices which are fetched concurrently by a pool of threads.
+    The pages are returned in the order that they arrive.
+    The worker threads only make requests to elasticsearch, they must never call into postgres.
+    """
+
+    def __init__(self, client, options, arguments, sort, sizer=None):
+        # (Elasticsearch, ElasticsearchFDWOptions, Dict[str, Any], Optional[str],
+        #  Optional[PageSizer]) -> None
+        super(SlicedScan, self).__init__(client, options, arguments, sort)
+        self.sizer = sizer or PageSizer(
+            options, options.scroll_size, options.scroll_size
+        )
+        self.scans = []
+        self.pit_id = None
+        self.executor = None
+        self.stopped = threading.Event()
+
+    def pages(self):
+        slices = self.options.scan_slices
+        if get_pagination(self.client, self.options) == "pit":
+            self.pit_id = open_point_in_time(
+                self.client, self.options, self.arguments["index"]
+            )
+        self.scans = [self._make_slice(index, slices) for index in range(slices)]
+
+        # Bound the number of pages waiting for postgres to limit memory use
+        results = queue.Queue(maxsize=self.options.scan_workers * 2)
+        self.executor = ThreadPoolExecutor(max_workers=self.options.scan_workers)
+        for scan in self.scans:
+            self.executor.submit(self._fetch, scan, results)
+
+        remaining = len(self.scans)
+        while remaining:
+            kind, value = results.get()
+            if kind == "done":
+                remaining -= 1
+            elif kind == "error":
+                raise value
+            else:
+                yield value
+
+    def close(self):
+        self.stopped.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for scan in self.scans:
+            scan.close()
+        self.scans = []
+        if self.pit_id:
+            close_point_in_time(self.client, self.pit_id)
+            self.pit_id = None
+
+    def describe(self):
+        if get_pagination(self.client, self.options) == "pit":
+            pagination = PointInTimeScan(
+                self.client, self.options, self.arguments, self.sort, sizer=self.sizer
+            )
+        else:
+            pagination = ScrollScan(
+                self.client, self.options, self.arguments, self.sort, sizer=self.sizer
+            )
+        return "{slices} slices read by {workers} workers, each a {pagination}".format(
+            slices=self.options.scan_slices,
+            workers=self.options.scan_workers,
+            pagination=pagination.describe(),
+        )
+
+    def _make_slice(self, index, slices):
+        # (int, int) -> Scan
+        arguments = self.arguments.copy()
+        arguments["body"] = dict(arguments.get("body", {}))
+        arguments["body"]["slice"] = {"id": index, "max": slices}
+        # Each slice adapts its own page size
+        if self.pit_id:
+            return PointInTimeScan(
+                self.client,
+                self.options,
+                arguments,
+                self.sort,
+                pit_id=self.pit_id,
+                sizer=self.sizer.copy(),
+            )
+        return ScrollScan(
+            self.client, self.options, arguments, self.sort, sizer=self.sizer.copy()
+        )
+
+    def _fetch(self, scan, results):
+        # (Scan, queue.Queue) -> None
+        try:
+            for hits in scan.pages():
+                if not self._put(results, ("page", hits)):
+                    return
+        except Exception as exception:
+            self._put(results, ("error", exception))
+            return
+        self._put(results, ("done", None))
+
+    def _put(self, results, item):
+        # (queue.Queue, Tuple[str, Any]) -> bool
+        while not self.stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+class PrefetchScan(Scan):
+    """
+    Fetches the next pages of another scan in a background thread
+    while postgres consumes the current page.
+    The number of waiting pages is limited by the prefetch depth and the number of waiting hits.
+    The background thread only makes requests to elasticsearch, it must never call into postgres.
+    """
+
+    def __init__(self, scan):
+        # (Scan) -> None
+        super(PrefetchScan, self).__init__(
+            scan.client, scan.options, scan.arguments, scan.sort
+        )
+        self.scan = scan
+        self.waiting = deque()
+        self.waiting_hits = 0
+        self.condition = threading.Condition()
+        self.finished = False
+        self.stopped = False
+        self.error = None
+        self.thread = None
+
+    def pages(self):
+        self.thread = threading.Thread(target=self._fetch)
+        self.thread.daemon = True
+        self.thread.start()
+
+        while True:
+            with self.condition:
+                while not self.waiting and not self.finished:
+                    self.condition.wait()
+                if not self.waiting:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                hits = self.waiting.popleft()
+                self.waiting_hits -= len(hits)
+                self.condition.notify_all()
+            yield hits
+
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.scan.close()
+
+    def describe(self):
+        return "{scan}, prefetching up to {pages} pages".format(
+            scan=self.scan.describe(), pages=self.options.prefetch_pages
+        )
+
+    def _fetch(self):
+        # () -> None
+        try:
+            pages = self.scan.pages()
+            while True:
+                with self.condition:
+                    while not self.stopped and self._is_full():
+                        self.condition.wait()
+                    if self.stopped:
+                        return
+                hits = next(pages, None)
+                if hits is None:
+                    return
+                with self.condition:
+                    self.waiting.append(hits)
+                    self.waiting_hits += len(hits)
+                    self.condition.notify_all()
+        except Exception as exception:
+            self.error = exception
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def _is_full(self):
+        # () -> bool
+        if not self.waiting:
+            return False
+        return (
+            len(self.waiting) >= self.options.prefetch_pages
+            or self.waiting_hits >= self.options.prefetch_max_hits
+        )
+
+
+class LimitScan(Scan):
+    """
+    Skips the offset and stops after the limit of the hits of another scan
+    """
+
+    def __init__(self, scan, limit, offset):
+        # (Scan, Optional[int], int) -> None
+        super(LimitScan, self).__init__(
+            scan.client, scan.options, scan.arguments, scan.sort
+        )
+        self.scan = scan
+        self.limit = limit
+        self.offset = offset
+
+    def pages(self):
+        skip = self.offset
+        remaining = self.limit
+        for hits in self.scan.pages():
+            if skip:
+                skipped = min(skip, len(hits))
+                hits = hits[skipped:]
+                skip -= skipped
+            if remaining is not None:
+                hits = hits[:remaining]
+                remaining -= len(hits)
+            if hits:
+                yield hits
+            if remaining == 0:
+                return
+
+    def close(self):
+        self.scan.close()
+
+    def describe(self):
+        return "{scan}, limited to {limit} hits from {offset}".format(
+            scan=self.scan.describe(),
+            limit="all" if self.limit is None else self.limit,
+            offset=self.offset,
+        )
+
+
+def make_scan(client, options, arguments, sort, limit=None, offset=None):
+    """
+    Create the scan for the pagination engine selected by the options.
+    Sorted searches are never sliced as the slices would interleave.
+    When the limit fits in a single page then no search context is created.
+    """
+    # (Elasticsearch, ElasticsearchFDWOptions, Dict[str, Any], Optional[str], Optional[int],
+    #  Optional[int]) -> Scan
+    offset = offset or 0
+    if limit is not None and offset + limit <= options.scroll_size:
+        return SingleScan(client, options, arguments, sort, size=limit, offset=offset)
+
+    sizer = make_page_sizer(client, options, arguments)
+    if options.scan_slices > 1 and not sort:
+        scan = SlicedScan(client, options, arguments, sort, sizer=sizer)
+    elif get_pagination(client, options) == "pit":
+        scan = PointInTimeScan(client, options, arguments, sort, sizer=sizer)
+    else:
+        scan = ScrollScan(client, options, arguments, sort, sizer=sizer)
+    if options.prefetch_pages > 0 and not isinstance(scan, SlicedScan):
+        scan = PrefetchScan(scan)
+    if limit is not None or offset:
+        scan = LimitScan(scan, limit=limit, offset=offset)
+    return scan
+
+
+class PageSizer(object):
+    """
+    Chooses the number of hits in each page of a scan.
+    Without adaptive paging this is the scroll_size option.
+    With adaptive paging the size moves towards the page byte and latency targets
+    using the bytes per hit and the latency of the previous full page,
+    within the page size limits and the result window of the index.
+    The size at most doubles between pages, as the latency of a larger page is only an estimate.
+    """
+
+    def __init__(self, options, size, maximum, key=None):
+        # (ElasticsearchFDWOptions, int, int, Optional[str]) -> None
+        self.options = options
+        self.size = size
+        self.maximum = maximum
+        # The key that the size is remembered by for the next scans
+        self.key = key
+
+    def observe(self, hits, received, seconds):
+        """
+        Adapt the size to a full page,
+        given the size of the response if it is known and the time the request took
+        """
+        # (int, Optional[int], float) -> None
+        if not self.options.adaptive_paging or not hits:
+            return
+        # The page that was read is the basis, as the size of a scroll does not change
+        sizes = [
+            hits * 2,
+            hits * self.options.page_target_ms / max(seconds * 1000.0, 1.0),
+        ]
+        if received:
+            sizes.append(self.options.page_target_bytes * hits / float(received))
+        size = max(self.options.page_size_min, int(min(sizes)))
+        self.size = min(size, self.maximum)
+
+    def copy(self):
+        """
+        Create a sizer that adapts separately, starting from the current size
+        """
+        # () -> PageSizer
+        return PageSizer(self.options, self.size, self.maximum, self.key)
+
+    def save(self):
+        """
+        Remember the size for the next scans of the index that read the same fields
+        """
+        # () -> None
+        if self.key is not None:
+            PAGE_SIZE_CACHE.set(self.key, self.size, ttl=PAGING_TTL)
+
+    def describe(self):
+        """
+        Describe the page size, for EXPLAIN
+        """
+        # () -> str
+        if not self.options.adaptive_paging:
+            return "pages of {size} hits".format(size=self.size)
+        return (
+            "adaptive pages of {minimum} to {maximum} hits starting at {size}".format(
+                minimum=min(self.options.page_size_min, self.maximum),
+                maximum=self.maximum,
+                size=self.size,
+            )
+        )
+
+
+def make_page_sizer(client, options, arguments):
+    """
+    Create the sizer for the pages of the scan.
+    An adaptive sizer starts from the size that the last scan of the index
+    reading the same fields ended with.
+    """
+    # (Optional[Elasticsearch], ElasticsearchFDWOptions, Dict[str, Any]) -> PageSizer
+    if not options.adaptive_paging:
+        return PageSizer(options, options.scroll_size, options.scroll_size)
+
+    window = get_max_result_window(client, options)
+    maximum = options.page_size_max
+    if window is not None:
+        maximum = min(maximum, window)
+    key = make_key("page_size", options.path, arguments.get("_source"))
+    size = PAGE_SIZE_CACHE.get(key) or options.scroll_size
+    size = min(max(options.page_size_min, size), maximum)
+    return PageSizer(options, size, maximum, key=key)
+
+
+def get_pagination(client, options):
+    """
+    Get the pagination engine that scans the index.
+    The auto engine uses a point in time when both the client and the cluster support it,
+    and the version of the cluster is read once for each client.
+    Without a client, as when the scan is only explained, the client version decides
+    unless the cluster version is cached.
+    """
+    # (Optional[Elasticsearch], ElasticsearchFDWOptions) -> str
+    if options.pagination != "auto":
+        return options.pagination
+    if tuple(ELASTICSEARCH_VERSION[:2]) < POINT_IN_TIME_VERSION:
+        return "scroll"
+
+    key = make_key("cluster_version", options.get_client_key())
+    version = STATISTICS_CACHE.get(key)
+    if version is None and client is not None:
+        try:
+            number = client.info()["version"]["number"]
+            version = tuple(int(part) for part in number.split("-")[0].split(".")[:2])
+        except Exception:
+            # Without a version the scroll api is used, which every cluster supports
+            version = (0, 0)
+        STATISTICS_CACHE.set(key, version, ttl=PAGING_TTL)
+    if version is not None and tuple(version) < POINT_IN_TIME_VERSION:
+        return "scroll"
+    return "pit"
+
+
+def get_max_result_window(client, options):
+    """
+    Get the largest page that the index allows,
+    which is the smallest max_result_window of the indices it covers.
+    The elasticsearch default is used when the settings cannot be read.
+    Without a client, as when the scan is only explained, this is None unless it is cached.
+    """
+    # (Optional[Elasticsearch], ElasticsearchFDWOptions) -> Optional[int]
+    key = make_key("max_result_window", options.get_client_key(), options.path)
+    window = STATISTICS_CACHE.get(key)
+    if window is not None or client is None:
+        return window
+
+    try:
+        response = client.indices.get_settings(
+            index=options.arguments["index"],
+            name="index.max_result_window",
+            include_defaults=True,
+        )
+    except Exception:
+        response = {}
+
+    windows = []
+    for settings in response.values():
+        for group in ["settings", "defaults"]:
+            value = settings.get(group, {}).get("index", {}).get("max_result_window")
+            if value is not None:
+                windows.append(int(value))
+                break
+    window = min(windows) if windows else DEFAULT_MAX_RESULT_WINDOW
+    STATISTICS_CACHE.set(key, window, ttl=PAGING_TTL)
+    return window
+
+
+def open_point_in_time(client, options, index):
+    """
+    Open a point in time against the index, returning the id
+    """
+    # (Elasticsearch, ElasticsearchFDWOptions, str) -> str
+    return client.open_point_in_time(index=index, keep_alive=options.keep_alive)["id"]
+
+
+def close_point_in_time(client, pit_id):
+    """
+    Close the point in time
+    """
+    # (Elasticsearch, str) -> None
+    # The response is not needed, so an async client does not wait for it
+    if ELASTICSEARCH_VERSION[0] >= 8:
+        send(client.close_point_in_time, id=pit_id)
+    else:
+        send(client.close_point_in_time, body={"id": pit_id})
+
+
+def get_sort_clause(sort, has_query):
+    """
+    Convert the sort into a sort clause that totally orders the documents.
+    The sort is either a sort clause or a comma separated list of fields with
+    an optional direction, for example "unit:asc,last_updated:desc".
+    """
+    # (Union[None, str, List[Dict[str, Any]]], bool) -> List[Any]
+    clause = []
+    if isinstance(sort, list):
+        clause.extend(sort)
+    elif sort:
+        for entry in sort.split(","):
+            field, _, direction = entry.strip().partition(":")
+            clause.append({field: direction} if direction else field)
+    elif has_query:
+        clause.append({"_score": "desc"})
+    clause.append({"_shard_doc": "asc"})
+    return clause
+
+
+def get_hits(response):
+    """
+    Get the hits from the search response.
+    A response trimmed with filter_path has no hits at all when nothing matched.
+    """
+    # (Dict[str, Any]) -> List[Dict[str, Any]]
+    return response.get("hits", {}).get("hits", [])
+
+
+def request(method, **arguments):
+    """
+    Make the request, returning the response, the seconds it took
+    and the size of the response if it is known
+    """
+    # (Callable[..., Any], **Any) -> Tuple[Any, float, Optional[int]]
+    take_received()
+    started = time.perf_counter()
+    response = method(**arguments)
+    return response, time.perf_counter() - started, take_received()
+
+
+def merge_arguments(arguments, extra):
+    """
+    Combine the elasticsearch client options, merging the bodies
+    """
+    # (Dict[str, Any], Dict[str, Any]) -> Dict[str, Any]
+    merged = arguments.copy()
+    for key, value in extra.items():
+        if key == "body":
+            merged["body"] = dict(merged.get("body") or {}, **value)
+        else:
+            merged[key] = value
+    return merged
@@ -0,0 +1,295 @@
+"""
+Encoding and decoding of json for requests and responses.
+The faster json libraries are used when they are installed.
+"""
+
+# pylint: disable=useless-object-inheritance, import-outside-toplevel, import-error
+
+import datetime
+import decimal
+import json
+import time
+from collections.abc import Mapping
+
+from elasticsearch import VERSION as ELASTICSEARCH_VERSION
+
+from .metrics import record_decode, record_encode
+
+if ELASTICSEARCH_VERSION[0] >= 8:
+    from elasticsearch.serializer import (  # pylint: disable=no-name-in-module
+        JsonSerializer as ClientJsonSerializer,
+    )
+else:
+    from elasticsearch.serializer import JSONSerializer as ClientJsonSerializer
+
+# The mimetypes of the json responses, elasticsearch 8 uses a versioned mimetype
+JSON_MIMETYPES = ["application/json", "application/vnd.elasticsearch+json"]
+
+
+class StandardSerializer(object):
+    """
+    Encodes and decodes json with the standard library
+    """
+
+    name = "json"
+
+    def loads(self, data):
+        """
+        Decode the json text or bytes
+        """
+        # (Union[str, bytes]) -> Any
+        return json.loads(data)
+
+    def dumps(self, value):
+        """
+        Encode the value as compact json text
+        """
+        # (Any) -> str
+        return json.dumps(value, separators=(",", ":"), default=json_default)
+
+    def to_raw(self, value):
+        """
+        Get the json text of a value from the document, as returned for json columns
+        """
+        # (Any) -> str
+        return json.dumps(value)
+
+
+class OrjsonSerializer(StandardSerializer):
+    """
+    Encodes and decodes json with orjson
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self.orjson = orjson
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+    def dumps(self, value):
+        return self.orjson.dumps(value, default=json_default).decode("utf-8")
+
+    def to_raw(self, value):
+        return self.dumps(value)
+
+
+class SimdjsonSerializer(object):
+    """
+    Decodes json with simdjson, and encodes it with the fastest other library.
+    The document source of each search hit is left undecoded, so json columns
+    are read as the minified text of the response without decoding it.
+    """
+
+    name = "simdjson"
+
+    def __init__(self, encoder):
+        # (StandardSerializer) -> None
+        import simdjson
+
+        self.simdjson = simdjson
+        self.encoder = encoder
+
+    def loads(self, data):
+        """
+        Decode the json text or bytes, leaving the document source of each hit undecoded
+        """
+        # (Union[str, bytes]) -> Any
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        # A parser can only hold one document, and the hits keep their document alive
+        document = self.simdjson.Parser().parse(data)
+        if not isinstance(document, self.simdjson.Object) or "hits" not in document:
+            return self._to_python(document)
+
+        response = self._to_python_object(document, skip="hits")
+        hits = document["hits"]
+        response["hits"] = self._to_python_object(hits, skip="hits")
+        if "hits" in hits:
+            response["hits"]["hits"] = [self._to_hit(hit) for hit in hits["hits"]]
+        return response
+
+    def dumps(self, value):
+        """
+        Encode the value as compact json text
+        """
+        # (Any) -> str
+        return self.encoder.dumps(value)
+
+    def _to_hit(self, hit):
+        # (simdjson.Object) -> Dict[str, Any]
+        result = self._to_python_object(hit, skip="_source")
+        if "_source" in hit:
+            result["_source"] = RawSource(self, hit["_source"])
+        return result
+
+    def _to_python_object(self, value, skip):
+        # (simdjson.Object, str) -> Dict[str, Any]
+        return {
+            key: self._to_python(item) for key, item in value.items() if key != skip
+        }
+
+    def _to_python(self, value):
+        # (Any) -> Any
+        if isinstance(value, self.simdjson.Object):
+            return value.as_dict()
+        if isinstance(value, self.simdjson.Array):
+            return value.as_list()
+        return value
+
+    def to_raw(self, value):
+        """
+        Get the json text of a value from the document
+        """
+        # (Any) -> str
+        if isinstance(value, (self.simdjson.Object, self.simdjson.Array)):
+            text = value.mini
+            if isinstance(text, bytes):
+                text = text.decode("utf-8")
+            return text
+        return self.encoder.dumps(value)
+
+
+class RawSource(Mapping):
+    """
+    The undecoded document source of a search hit.
+    Fields are decoded when they are read, and can be read as json text without decoding.
+    """
+
+    def __init__(self, serializer, source):
+        # (SimdjsonSerializer, simdjson.Object) -> None
+        self.serializer = serializer
+        self.source = source
+
+    def __getitem__(self, name):
+        # (str) -> Any
+        return self.serializer._to_python(  # pylint: disable=protected-access
+            self.source[name]
+        )
+
+    def __contains__(self, name):
+        # (object) -> bool
+        return name in self.source
+
+    def __iter__(self):
+        return iter(self.source.keys())
+
+    def __len__(self):
+        return len(self.source)
+
+    def raw(self, name):
+        """
+        Get the json text of the field
+        """
+        # (str) -> str
+        return self.serializer.to_raw(self.source[name])
+
+
+def make_serializer(name):
+    """
+    Create the serializer for the json library.
+    The auto serializer uses the fastest library that is installed.
+    """
+    # (str) -> Union[StandardSerializer, SimdjsonSerializer]
+    if name == "json":
+        return StandardSerializer()
+    if name == "auto":
+        encoder = _try_serializer(OrjsonSerializer) or StandardSerializer()
+        return _try_serializer(SimdjsonSerializer, encoder) or encoder
+
+    try:
+        if name == "orjson":
+            return OrjsonSerializer()
+        encoder = _try_serializer(OrjsonSerializer) or StandardSerializer()
+        return SimdjsonSerializer(encoder)
+    except ImportError as error:
+        raise ValueError(
+            "serializer {name} requires the {name} package: {error}".format(
+                name=name, error=error
+            )
+        ) from error
+
+
+def get_client_arguments(serializer):
+    """
+    Get the elasticsearch client options that make it use the serializer for json
+    """
+    # (Union[StandardSerializer, SimdjsonSerializer]) -> Dict[str, Any]
+    # The standard library is adapted too, so that the json is measured for the metrics
+    if ELASTICSEARCH_VERSION[0] >= 8:
+
+        class ClientSerializer(ClientJsonSerializer):
+            """
+            Adapts the serializer to the elasticsearch 8 client, which works with bytes
+            """
+
+            def loads(self, data):
+                """
+                Decode the response body
+                """
+                return _measured_loads(serializer, data)
+
+            def dumps(self, data):
+                """
+                Encode the request body, which is sent as it is when it is already encoded
+                """
+                if isinstance(data, str):
+                    return data.encode("utf-8")
+                if isinstance(data, bytes):
+                    return data
+                encoded = serializer.dumps(data).encode("utf-8")
+                record_encode(len(encoded))
+                return encoded
+
+        client_serializer = ClientSerializer()
+        return {
+            "serializers": {mimetype: client_serializer for mimetype in JSON_MIMETYPES}
+        }
+
+    class LegacyClientSerializer(ClientJsonSerializer):
+        """
+        Adapts the serializer to the elasticsearch 5 to 7 clients, which work with text
+        """
+
+        def loads(self, s):
+            return _measured_loads(serializer, s)
+
+        def dumps(self, data):
+            if isinstance(data, str):
+                return data
+            encoded = serializer.dumps(data)
+            record_encode(len(encoded))
+            return encoded
+
+    return {"serializer": LegacyClientSerializer()}
+
+
+def json_default(value):
+    """
+    Convert the values that json cannot represent
+    """
+    # (Any) -> Any
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+
+def _measured_loads(serializer, data):
+    # (Union[StandardSerializer, SimdjsonSerializer], Union[str, bytes]) -> Any
+    started = time.perf_counter()
+    result = serializer.loads(data)
+    record_decode(len(data), time.perf_counter() - started)
+    return result
+
+
+def _try_serializer(serializer_class, *arguments):
+    # (Type, *Any) -> Optional[Any]
+    try:
+        return serializer_class(*arguments)
+    except ImportError:
+        return None
@@ -0,0 +1,178 @@
+"""
+Statistics about the elasticsearch index that help the postgres planner.
+These are read from the index mapping and a sample of the documents.
+"""
+
+# pylint: disable=useless-object-inheritance, too-many-arguments
+
+import json
+
+# The width used when nothing is known about a column
+DEFAULT_WIDTH = 100
+
+# The widths of the postgres representation of the fixed size elasticsearch types
+FIXED_WIDTHS = {
+    "long": 8,
+    "integer": 4,
+    "short": 2,
+    "byte": 2,
+    "double": 8,
+    "float": 4,
+    "half_float": 4,
+    "scaled_float": 8,
+    "boolean": 1,
+    "date": 8,
+}
+
+# The postgres default selectivities, from src/include/utils/selfuncs.h
+DEFAULT_EQ_SEL = 0.005
+DEFAULT_INEQ_SEL = 0.3333333333333333
+DEFAULT_MATCH_SEL = 0.005
+
+
+class Statistics(object):
+    """
+    The average width, fraction of missing values and number of distinct values of each column
+    """
+
+    def __init__(self, widths, null_fractions, cardinalities):
+        # (Dict[str, int], Dict[str, float], Dict[str, int]) -> None
+        self.widths = widths
+        self.null_fractions = null_fractions
+        self.cardinalities = cardinalities
+
+    def get_width(self, columns):
+        """
+        Get the average width of a row containing the requested columns
+        """
+        # (Iterable[str]) -> int
+        return sum(self.widths.get(column, DEFAULT_WIDTH) for column in columns)
+
+    def get_selectivity(self, quals):
+        """
+        Get the fraction of the rows that match all of the qualifiers.
+        The qualifiers are assumed to be independent.
+        """
+        # (List[multicorn.Qual]) -> float
+        selectivity = 1.0
+        for qual in quals:
+            selectivity *= self._get_qual_selectivity(qual)
+        return selectivity
+
+    def _get_qual_selectivity(self, qual):
+        # (multicorn.Qual) -> float
+        name = qual.field_name
+        if name not in self.null_fractions:
+            return 1.0
+        null_fraction = self.null_fractions[name]
+        cardinality = self.cardinalities.get(name)
+        equal = 1.0 / cardinality if cardinality else DEFAULT_EQ_SEL
+
+        if qual.is_list_operator:
+            return _get_list_selectivity(qual, equal, null_fraction)
+        return _get_scalar_selectivity(qual, equal, null_fraction)
+
+
+EMPTY_STATISTICS = Statistics(widths={}, null_fractions={}, cardinalities={})
+
+
+def load_statistics(client, options, columns):
+    """
+    Read the statistics for the columns from the index mapping and a sample of the documents
+    """
+    # (Elasticsearch, ElasticsearchFDWOptions, Columns) -> Statistics
+    field_types = _get_field_types(
+        client.indices.get_mapping(index=options.arguments["index"])
+    )
+
+    aggregations = {
+        column.name: {"cardinality": {"field": column.filter_field}}
+        for column in columns.columns
+        if column.filter_field is not None
+    }
+    arguments = options.arguments.copy()
+    arguments["body"] = {"size": options.statistics_sample_size, "aggs": aggregations}
+    response = client.search(**arguments)
+    hits = response["hits"]["hits"]
+    cardinalities = {
+        name: aggregation["value"]
+        for name, aggregation in response.get("aggregations", {}).items()
+    }
+
+    widths = {}
+    null_fractions = {}
+    for column in columns.columns:
+        values = [
+            hit["_source"][column.name]
+            for hit in hits
+            if hit.get("_source", {}).get(column.name) is not None
+        ]
+        null_fractions[column.name] = (
+            1.0 - len(values) / float(len(hits)) if hits else 0.0
+        )
+        widths[column.name] = _get_width(field_types.get(column.name), values)
+
+    widths[columns.id_column.name] = _get_width(None, [hit["_id"] for hit in hits])
+    if columns.score_column is not None:
+        widths[columns.score_column.name] = 8
+
+    return Statistics(
+        widths=widths, null_fractions=null_fractions, cardinalities=cardinalities
+    )
+
+
+def _get_width(field_type, values):
+    # (Optional[str], List[Any]) -> int
+    if field_type in FIXED_WIDTHS:
+        return FIXED_WIDTHS[field_type]
+    if not values:
+        return DEFAULT_WIDTH
+    total = sum(
+        len(value) if isinstance(value, str) else len(json.dumps(value))
+        for value in values
+    )
+    # variable length values have a four byte header in postgres
+    return 4 + total // len(values)
+
+
+def _get_field_types(mapping):
+    """
+    Extract the types of the top level fields from the index mapping.
+    Before elasticsearch 7 the properties are nested under the document type.
+    """
+    # (Dict[str, Any]) -> Dict[str, str]
+    field_types = {}
+    for index in mapping.values():
+        mappings = index.get("mappings", {})
+        if "properties" not in mappings:
+            mappings = next(iter(mappings.values()), {})
+        for name, field in mappings.get("properties", {}).items():
+            field_types.setdefault(name, field.get("type", "object"))
+    return field_types
+
+
+def _get_list_selectivity(qual, equal, null_fraction):
+    # (multicorn.Qual, float, float) -> float
+    operator, is_any = qual.operator
+    matches = min(1.0, equal * len(qual.value))
+    if operator == "=" and is_any:
+        return matches * (1.0 - null_fraction)
+    if operator == "<>" and not is_any:
+        return (1.0 - matches) * (1.0 - null_fraction)
+    return 1.0
+
+
+def _get_scalar_selectivity(qual, equal, null_fraction):
+    # (multicorn.Qual, float, float) -> float
+    if qual.value is None:
+        is_null = qual.operator in {"=", "IS"}
+        return null_fraction if is_null else 1.0 - null_fraction
+    if qual.operator == "=":
+        return equal * (1.0 - null_fraction)
+    if qual.operator == "<>":
+        return (1.0 - equal) * (1.0 - null_fraction)
+    if qual.operator in {"<", "<=", ">", ">="}:
+        return DEFAULT_INEQ_SEL
+    if qual.operator in {"~~", "~~*"}:
+        return DEFAULT_MATCH_SEL
+    return 1.0
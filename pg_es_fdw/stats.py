@@ -0,0 +1,189 @@
+"""
+Cumulative performance counters for the elasticsearch tables of this backend,
+and the foreign data wrapper that exposes them to sql.
+"""
+
+# pylint: disable=useless-object-inheritance, import-error, too-many-instance-attributes
+
+import json
+from collections import Counter
+
+from multicorn import ForeignDataWrapper
+
+from .metrics import LATENCY_BUCKETS
+
+# The counters that are summed over every scan and modification of an index
+SUMMED_COUNTERS = [
+    "errors",
+    "request_seconds",
+    "took",
+    "bytes_sent",
+    "bytes_received",
+    "decode_seconds",
+    "deserialize_seconds",
+    "contexts_opened",
+    "contexts_cleared",
+    "bulk_actions",
+    "bulk_failures",
+    "quals_pushed",
+    "quals_rechecked",
+    "sorts_pushed",
+    "limits_pushed",
+    "aggregates_pushed",
+    "aggregates_local",
+    "cache_hits",
+    "cache_misses",
+]
+
+
+class IndexStats(object):
+    """
+    The counters of every scan and modification of a single index
+    """
+
+    def __init__(self, path):
+        # (str) -> None
+        self.path = path
+        self.scans = 0
+        self.modifications = 0
+        self.rows_read = 0
+        self.rows_written = 0
+        self.requests = Counter()
+        self.latencies = Counter()
+        self.counters = Counter()
+
+    def add(self, metrics):
+        """
+        Add the metrics of a scan or modification that has ended
+        """
+        # (Dict[str, Any]) -> None
+        if metrics["kind"] == "scan":
+            self.scans += 1
+            self.rows_read += metrics["rows"]
+        else:
+            self.modifications += 1
+            self.rows_written += metrics["rows"]
+        self.requests.update(metrics["requests"])
+        self.latencies.update(metrics["latencies"])
+        self.counters.update({name: metrics[name] for name in SUMMED_COUNTERS})
+
+    def to_row(self):
+        """
+        Get the counters as a row of the stats table.
+        The requests by api and the latency histogram are json objects.
+        """
+        # () -> Dict[str, Any]
+        counters = self.counters
+        bulk_requests = self.requests.get("bulk", 0)
+        row = {
+            "path": self.path,
+            "scans": self.scans,
+            "modifications": self.modifications,
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "requests": sum(self.requests.values()),
+            "requests_by_api": json.dumps(dict(self.requests), sort_keys=True),
+            "request_errors": counters["errors"],
+            "request_seconds": counters["request_seconds"],
+            "request_latency_ms": json.dumps(
+                {
+                    str(bucket): self.latencies.get(str(bucket), 0)
+                    for bucket in LATENCY_BUCKETS + ["inf"]
+                }
+            ),
+            "took_seconds": counters["took"] / 1000.0,
+            "bulk_requests": bulk_requests,
+            "bulk_average_actions": (
+                counters["bulk_actions"] / float(bulk_requests)
+                if bulk_requests
+                else None
+            ),
+            "cache_hit_rate": _rate(counters["cache_hits"], counters["cache_misses"]),
+            "qual_pushdown_rate": _rate(
+                counters["quals_pushed"], counters["quals_rechecked"]
+            ),
+            "aggregate_pushdown_rate": _rate(
+                counters["aggregates_pushed"], counters["aggregates_local"]
+            ),
+        }
+        for name in SUMMED_COUNTERS:
+            if name not in {"errors", "request_seconds", "took"}:
+                row[name] = counters[name]
+        return row
+
+
+class StatsRegistry(object):
+    """
+    Holds the counters of each index used by this backend.
+    Each postgres backend is a separate process,
+    so the counters start from zero for each connection.
+    """
+
+    def __init__(self):
+        # () -> None
+        self.indexes = {}
+
+    def add(self, metrics):
+        """
+        Add the metrics of a scan or modification that has ended
+        """
+        # (Metrics) -> None
+        metrics = metrics.as_dict()
+        stats = self.indexes.get(metrics["path"])
+        if stats is None:
+            stats = self.indexes[metrics["path"]] = IndexStats(metrics["path"])
+        stats.add(metrics)
+
+    def get_rows(self):
+        """
+        Get the counters of each index as rows, ordered by path
+        """
+        # () -> List[Dict[str, Any]]
+        return [self.indexes[path].to_row() for path in sorted(self.indexes)]
+
+    def clear(self):
+        """
+        Reset every counter
+        """
+        # () -> None
+        self.indexes.clear()
+
+
+STATS = StatsRegistry()
+
+
+class ElasticsearchStatsFDW(ForeignDataWrapper):
+    """
+    Exposes the cumulative counters of the elasticsearch tables in this backend, one row per index.
+    Deleting from the table resets the counters.
+    """
+
+    @property
+    def rowid_column(self):
+        """The index path identifies each row."""
+
+        return "path"
+
+    def __init__(self, options, columns):
+        super(ElasticsearchStatsFDW, self).__init__(options, columns)
+        self.columns = list(columns)
+
+    def execute(self, quals, columns, sortkeys=None):  # pylint: disable=unused-argument
+        """Return the counters of each index"""
+
+        columns = columns or self.columns
+        for row in STATS.get_rows():
+            yield {column: row.get(column) for column in columns}
+
+    def delete(self, path):
+        """Reset the counters of the index"""
+
+        STATS.indexes.pop(path, None)
+
+
+def _rate(hits, misses):
+    # (float, float) -> Optional[float]
+    total = hits + misses
+    if not total:
+        return None
+    return hits / float(total)
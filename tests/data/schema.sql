@@ -5,6 +5,11 @@ OPTIONS (
   wrapper 'pg_es_fdw.ElasticsearchFDW'
 );
 
+CREATE SERVER multicorn_es_stats FOREIGN DATA WRAPPER multicorn
+OPTIONS (
+  wrapper 'pg_es_fdw.ElasticsearchStatsFDW'
+);
+
 CREATE TABLE articles
     (
         id BIGINT,
@@ -152,5 +157,151 @@ OPTIONS
     )
 ;
 
+CREATE FOREIGN TABLE articles_es_filtered
+    (
+        id BIGINT,
+        title TEXT,
+        body TEXT,
+        length BIGINT
+    )
+SERVER multicorn_es
+OPTIONS
+    (
+        host 'elasticsearch',
+        port '9200',
+        index 'article-index',
+        type 'article',
+        rowid_column 'id',
+        timeout '20',
+        username 'elastic',
+        password 'changeme',
+        scheme 'http',
+        keyword_columns 'title:title.keyword'
+    )
+;
+
+CREATE FOREIGN TABLE articles_es_paged
+    (
+        id BIGINT,
+        title TEXT,
+        body TEXT
+    )
+SERVER multicorn_es
+OPTIONS
+    (
+        host 'elasticsearch',
+        port '9200',
+        index 'article-index',
+        type 'article',
+        rowid_column 'id',
+        timeout '20',
+        username 'elastic',
+        password 'changeme',
+        scheme 'http',
+        scroll_size '10'
+    )
+;
+
+CREATE FOREIGN TABLE articles_es_sliced
+    (
+        id BIGINT,
+        title TEXT,
+        body TEXT
+    )
+SERVER multicorn_es
+OPTIONS
+    (
+        host 'elasticsearch',
+        port '9200',
+        index 'article-index',
+        type 'article',
+        rowid_column 'id',
+        timeout '20',
+        username 'elastic',
+        password 'changeme',
+        scheme 'http',
+        scroll_size '10',
+        scan_slices '3'
+    )
+;
+
+CREATE FOREIGN TABLE articles_es_prefetch
+    (
+        id BIGINT,
+        title TEXT,
+        body TEXT
+    )
+SERVER multicorn_es
+OPTIONS
+    (
+        host 'elasticsearch',
+        port '9200',
+        index 'article-index',
+        type 'article',
+        rowid_column 'id',
+        timeout '20',
+        username 'elastic',
+        password 'changeme',
+        scheme 'http',
+        scroll_size '10',
+        prefetch_pages '2'
+    )
+;
+
+CREATE FOREIGN TABLE articles_es_estimated
+    (
+        id BIGINT,
+        title TEXT,
+        body TEXT
+    )
+SERVER multicorn_es
+OPTIONS
+    (
+        host 'elasticsearch',
+        port '9200',
+        index 'article-index',
+        type 'article',
+        rowid_column 'id',
+        timeout '20',
+        username 'elastic',
+        password 'changeme',
+        scheme 'http',
+        count_estimate 'index'
+    )
+;
+
+CREATE FOREIGN TABLE articles_es_coalesced
+    (
+        id BIGINT,
+        title TEXT,
+        body TEXT
+    )
+SERVER multicorn_es
+OPTIONS
+    (
+        host 'elasticsearch',
+        port '9200',
+        index 'article-index',
+        type 'article',
+        rowid_column 'id',
+        timeout '20',
+        username 'elastic',
+        password 'changeme',
+        scheme 'http',
+        refresh 'wait_for',
+        coalesce_writes 'true'
+    )
+;
+
+CREATE FOREIGN TABLE es_fdw_stats
+    (
+        path TEXT,
+        scans BIGINT,
+        rows_read BIGINT,
+        requests BIGINT,
+        requests_by_api JSONB
+    )
+SERVER multicorn_es_stats
+;
 
 \q
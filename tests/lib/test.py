@@ -49,10 +49,37 @@ def perform_tests(pg_version, es_version):
     ):
         success = False
 
+    show_status("Testing paged read...")
+    data, error = run_sql_test("paged-read.sql")
+    if not show_result(pg_version, es_version, "paged-read", (data == "t", error)):
+        success = False
+
+    show_status("Testing sliced read...")
+    data, error = run_sql_test("sliced-read.sql")
+    if not show_result(pg_version, es_version, "sliced-read", (data == "t", error)):
+        success = False
+
+    show_status("Testing prefetched read...")
+    data, error = run_sql_test("prefetch-read.sql")
+    if not show_result(pg_version, es_version, "prefetch-read", (data == "t", error)):
+        success = False
+
+    show_status("Testing estimated read...")
+    data, error = run_sql_test("estimated-read.sql")
+    if not show_result(pg_version, es_version, "estimated-read", (data == "t", error)):
+        success = False
+
     show_status("Testing query...")
     if not show_result(pg_version, es_version, "query", run_sql_test("query.sql")):
         success = False
 
+    show_status("Testing trimmed read...")
+    data, error = run_sql_test("trimmed-read.sql")
+    if not show_result(
+        pg_version, es_version, "trimmed-read", (data == "0 | 39393511 | 1", error)
+    ):
+        success = False
+
     show_status("Testing json query...")
     data, error = run_sql_test("json-query.sql")
     if not show_result(
@@ -60,6 +87,111 @@ def perform_tests(pg_version, es_version):
     ):
         success = False
 
+    show_status("Testing filtered read...")
+    data, error = run_sql_test("filtered-read.sql")
+    if not show_result(
+        pg_version, es_version, "filtered-read", (data == "Portal Chess", error)
+    ):
+        success = False
+
+    show_status("Testing term filtered read...")
+    data, error = run_sql_test("filtered-term-read.sql")
+    if not show_result(
+        pg_version,
+        es_version,
+        "filtered-term-read",
+        (
+            data
+            == "Mad Conductor, Deuel County Courthouse"
+            " | 2013 BS45, File:More Than Words Can Say album cover.jpg, File:Lola Colt.jpg"
+            " | 98",
+            error,
+        ),
+    ):
+        success = False
+
+    show_status("Testing range filtered read...")
+    data, error = run_sql_test("filtered-range-read.sql")
+    if not show_result(
+        pg_version,
+        es_version,
+        "filtered-range-read",
+        (
+            data
+            == "Kenneth Blaxter (animal nutritionist), Parel van de Veluwe | 0 | 100",
+            error,
+        ),
+    ):
+        success = False
+
+    show_status("Testing like filtered read...")
+    data, error = run_sql_test("filtered-like-read.sql")
+    if not show_result(
+        pg_version,
+        es_version,
+        "filtered-like-read",
+        (
+            data
+            == "File:More Than Words Can Say album cover.jpg, File:Lola Colt.jpg,"
+            " File:Buggles Lenny.ogg | Boxerbeat",
+            error,
+        ),
+    ):
+        success = False
+
+    show_status("Testing keyword filtered read...")
+    data, error = run_sql_test("filtered-keyword-read.sql")
+    if not show_result(
+        pg_version,
+        es_version,
+        "filtered-keyword-read",
+        (
+            data
+            == "Portal Chess, Boxerbeat | Portal Chess, Boxerbeat | Portal Chess",
+            error,
+        ),
+    ):
+        success = False
+
+    show_status("Testing sort pushdown read...")
+    data, error = run_sql_test("sort-pushdown-read.sql")
+    if not show_result(
+        pg_version,
+        es_version,
+        "sort-pushdown-read",
+        (
+            data
+            == "Thanks for Sharing, Kenneth Blaxter (animal nutritionist),"
+            " Parel van de Veluwe | File:Lola Colt.jpg, Paxilla (ossicle)",
+            error,
+        ),
+    ):
+        success = False
+
+    show_status("Testing limited read...")
+    data, error = run_sql_test("limit-read.sql")
+    if not show_result(pg_version, es_version, "limit-read", (data == "5", error)):
+        success = False
+
+    show_status("Testing limited read with a rechecked filter...")
+    data, error = run_sql_test("limit-rechecked-read.sql")
+    if not show_result(
+        pg_version, es_version, "limit-rechecked-read", (data == "10", error)
+    ):
+        success = False
+
+    show_status("Testing aggregated read...")
+    data, error = run_sql_test("aggregate-read.sql")
+    if not show_result(
+        pg_version, es_version, "aggregate-read", (data == "100", error)
+    ):
+        success = False
+
+    show_status("Testing stats read...")
+    data, error = run_sql_test("stats-read.sql")
+    if not show_result(pg_version, es_version, "stats-read", (data == "100", error)):
+        success = False
+
     show_status("Testing insert returning id...")
     data, error = run_sql_test("insert-return-id.sql")
     if not show_result(
@@ -97,6 +229,33 @@ def perform_tests(pg_version, es_version):
     ):
         success = False
 
+    show_status("Testing coalesced insert and update...")
+    data, error = run_sql_test("coalesce-insert-update.sql")
+    if not show_result(
+        pg_version,
+        es_version,
+        "coalesced insert and update",
+        (data == "4 | Test coalesced update title | test coalesced insert body", error),
+    ):
+        success = False
+
+    show_status("Testing coalesced insert and delete...")
+    data, error = run_sql_test("coalesce-insert-delete.sql")
+    if not show_result(
+        pg_version, es_version, "coalesced insert and delete", (data == "0 | 0", error)
+    ):
+        success = False
+
+    show_status("Testing coalesced rollback to savepoint...")
+    data, error = run_sql_test("coalesce-savepoint.sql")
+    if not show_result(
+        pg_version,
+        es_version,
+        "coalesced rollback to savepoint",
+        (data == "6 | Test savepoint title | test savepoint body", error),
+    ):
+        success = False
+
     return success
 
 
@@ -0,0 +1,5 @@
+SELECT
+    count(*)
+FROM
+    articles_es
+;
@@ -0,0 +1,20 @@
+BEGIN;
+INSERT INTO articles_es_coalesced (id, title, body)
+VALUES (5, 'Test coalesced delete title', 'test coalesced delete body');
+DELETE FROM articles_es_coalesced WHERE id = 5;
+COMMIT;
+SELECT
+    concat_ws(
+        ' | ',
+        (
+            SELECT count(*)
+            FROM articles_es_coalesced
+            WHERE id = 5
+        ),
+        (
+            SELECT coalesce(sum((requests_by_api->>'bulk')::int), 0)
+            FROM es_fdw_stats
+            WHERE path LIKE '/article-index%'
+        )
+    )
+;
@@ -0,0 +1,6 @@
+BEGIN;
+INSERT INTO articles_es_coalesced (id, title, body)
+VALUES (4, 'Test coalesced insert title', 'test coalesced insert body');
+UPDATE articles_es_coalesced SET title = 'Test coalesced update title' WHERE id = 4;
+COMMIT;
+SELECT id, title, body FROM articles_es_coalesced WHERE id = 4;
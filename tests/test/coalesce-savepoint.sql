@@ -0,0 +1,8 @@
+BEGIN;
+INSERT INTO articles_es_coalesced (id, title, body)
+VALUES (6, 'Test savepoint title', 'test savepoint body');
+SAVEPOINT before_update;
+UPDATE articles_es_coalesced SET title = 'Test rolled back title' WHERE id = 6;
+ROLLBACK TO SAVEPOINT before_update;
+COMMIT;
+SELECT id, title, body FROM articles_es_coalesced WHERE id = 6;
@@ -0,0 +1,20 @@
+SELECT
+    concat_ws(
+        ' | ',
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es_filtered
+            WHERE title IN ('Portal Chess', 'Boxerbeat')
+        ),
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es
+            WHERE title IN ('Portal Chess', 'Boxerbeat')
+        ),
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es_filtered
+            WHERE length = 8087
+        )
+    )
+;
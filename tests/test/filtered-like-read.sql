@@ -0,0 +1,15 @@
+SELECT
+    concat_ws(
+        ' | ',
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es_filtered
+            WHERE title LIKE 'File:%'
+        ),
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es_filtered
+            WHERE title LIKE 'Boxerbea_'
+        )
+    )
+;
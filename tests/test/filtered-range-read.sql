@@ -0,0 +1,20 @@
+SELECT
+    concat_ws(
+        ' | ',
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es_filtered
+            WHERE length >= 9476 AND length < 10048
+        ),
+        (
+            SELECT count(*)
+            FROM articles_es_filtered
+            WHERE length IS NULL
+        ),
+        (
+            SELECT count(*)
+            FROM articles_es_filtered
+            WHERE length IS NOT NULL
+        )
+    )
+;
@@ -0,0 +1,7 @@
+SELECT
+    title
+FROM
+    articles_es
+WHERE
+    id = 39393511
+;
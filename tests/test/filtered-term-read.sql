@@ -0,0 +1,20 @@
+SELECT
+    concat_ws(
+        ' | ',
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es_filtered
+            WHERE length = 2171
+        ),
+        (
+            SELECT string_agg(title, ', ' ORDER BY id)
+            FROM articles_es_filtered
+            WHERE length IN (1055, 1276, 8222)
+        ),
+        (
+            SELECT count(*)
+            FROM articles_es_filtered
+            WHERE length <> 2171
+        )
+    )
+;
@@ -0,0 +1,5 @@
+SELECT
+    count(*)
+FROM
+    (SELECT id FROM articles_es LIMIT 5 OFFSET 2) AS limited
+;
@@ -0,0 +1,5 @@
+SELECT
+    count(*)
+FROM
+    (SELECT id FROM articles_es WHERE title ILIKE '%a%' LIMIT 10) AS limited
+;
@@ -0,0 +1,9 @@
+SELECT
+    DISTINCT (pg.id = es.id AND pg.title = es.title AND pg.body = es.body)
+FROM
+    articles AS pg
+FULL OUTER JOIN
+    articles_es_paged AS es
+ON
+    pg.id = es.id
+;
@@ -0,0 +1,23 @@
+SELECT
+    concat_ws(
+        ' | ',
+        (
+            SELECT string_agg(title, ', ')
+            FROM (
+                SELECT title
+                FROM articles_es_filtered
+                ORDER BY length DESC
+                LIMIT 3
+            ) AS longest
+        ),
+        (
+            SELECT string_agg(title, ', ')
+            FROM (
+                SELECT title
+                FROM articles_es_filtered
+                ORDER BY length
+                LIMIT 2
+            ) AS shortest
+        )
+    )
+;
@@ -0,0 +1,14 @@
+\o /dev/null
+SELECT
+    id
+FROM
+    articles_es
+;
+\o
+SELECT
+    rows_read
+FROM
+    es_fdw_stats
+WHERE
+    path LIKE '/article-index%'
+;
@@ -0,0 +1,22 @@
+SELECT
+    concat_ws(
+        ' | ',
+        (
+            SELECT count(*)
+            FROM articles AS pg
+            FULL OUTER JOIN (SELECT id FROM articles_es) AS es
+            ON pg.id = es.id
+            WHERE pg.id IS NULL OR es.id IS NULL
+        ),
+        (
+            SELECT string_agg(id::text, ', ')
+            FROM articles_es
+            WHERE query = 'body:chess'
+        ),
+        (
+            SELECT count(*)
+            FROM articles_es
+            WHERE query = 'body:chess' AND score > 0
+        )
+    )
+;